@@ -1,34 +1,66 @@
 import asyncio
 import aiohttp
 import os
-from typing import Optional
+from typing import AsyncIterator, Optional
 from contextlib import AsyncExitStack
 from mcp import ClientSession, StdioServerParameters
+from mcp import types as mcp_types
 from mcp.client.stdio import stdio_client
 from dotenv import load_dotenv
 from google import genai
 from google.genai import types
 
+from mirror.memory import ConversationMemory
+
 INTERACTION_SERVICE_URL = os.getenv(
     "INTERACTION_SERVICE_URL", "http://localhost:8000/api"
 )
 load_dotenv()
 TEMPERATURE=0.0
+# Maximum number of read-only tool calls from one model turn run at once.
+TOOL_CALL_CONCURRENCY = int(os.getenv("MCP_TOOL_CONCURRENCY", "4"))
+# Approximate token budget of the history re-sent on every call. Past it, turns
+# older than the last MCP_HISTORY_RECENT_TURNS are folded into a summary; their
+# tool results are replaced with stubs as soon as they are that old.
+HISTORY_TOKEN_BUDGET = int(os.getenv("MCP_HISTORY_TOKEN_BUDGET", "16000"))
+HISTORY_RECENT_TURNS = int(os.getenv("MCP_HISTORY_RECENT_TURNS", "4"))
+SUMMARY_PROMPT = (
+    "Summarize this conversation between a user and their smart mirror assistant "
+    "in a few short sentences. Keep facts, names, ids, dates and preferences that "
+    "later requests may refer to; drop pleasantries and tool mechanics."
+)
 
 class MCPClient:
-    def __init__(self, fake=False):
+    def __init__(self, fake=False, publish_thought=None):
         self.session: Optional[ClientSession] = None
+        # One session per server process; self.session is the first. Tool
+        # calls go to the one with the fewest calls in flight.
+        self.sessions: list[ClientSession] = []
+        self.calls_in_flight: list[int] = []
         self.exit_stack = AsyncExitStack()
         self.genai_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
         self.model_id = "gemini-2.0-flash"
-        self.history: list[types.Content] = []
+        # History of process_query calls that don't pass their own memory.
+        self.memory = self.new_memory()
+        # Gemini declarations of the server's tools, built on first use after
+        # connecting and dropped when the server's tool list changes.
+        self.gemini_tools: Optional[types.Tool] = None
+        # Tools annotated readOnlyHint, which may run concurrently.
+        self.read_only_tools: set[str] = set()
         self.interaction_service_url = INTERACTION_SERVICE_URL
         self.fake = fake
+        # Non-blocking callable taking a thought, e.g. mirror.thoughts.thought_bus.publish
+        # when running inside the Django process; otherwise thoughts are POSTed
+        # to interaction_service_url.
+        self.publish_thought = publish_thought
 
     async def send_thought(self, thought):
         if self.fake:
             print(thought)
             return True
+        if self.publish_thought is not None:
+            self.publish_thought(thought)
+            return True
         payload_to_service = {"thought": thought}
         service_url = self.interaction_service_url
         async with aiohttp.ClientSession() as session:
@@ -48,66 +80,100 @@ class MCPClient:
             f"Executing {len(function_calls)} tool call{'s' if len(function_calls) > 1 else ''}..."
         )
 
-        for func_call in function_calls:
-            tool_name = func_call.name
-            args = func_call.args if isinstance(func_call.args, dict) else {}
-            await self.send_thought(
-                f"Attempting to call '{tool_name}' with args '{args}'"
-            )
-
-            tool_result_payload: dict[str, Any]
-            try:
-                tool_result = await self.session.call_tool(tool_name, args)
-                await self.send_thought(
-                    f"  Session tool '{tool_name}' execution finished."
+        # Consecutive read-only calls run concurrently, at most
+        # TOOL_CALL_CONCURRENCY at a time; any other call runs alone, so it
+        # sees the effects of the calls before it. Parts keep the call order.
+        semaphore = asyncio.Semaphore(TOOL_CALL_CONCURRENCY)
+
+        async def call_limited(func_call):
+            async with semaphore:
+                return await self._call_tool(func_call)
+
+        i = 0
+        while i < len(function_calls):
+            j = i
+            while j < len(function_calls) and function_calls[j].name in self.read_only_tools:
+                j += 1
+            if j == i:
+                tool_response_parts.append(await self._call_tool(function_calls[i]))
+                i += 1
+            else:
+                tool_response_parts += await asyncio.gather(
+                    *(call_limited(func_call) for func_call in function_calls[i:j])
                 )
-                result_text = ""
-                if (
-                    hasattr(tool_result, "content")
-                    and tool_result.content
-                    and hasattr(tool_result.content[0], "text")
-                ):
-                    result_text = tool_result.content[0].text or ""
-                if hasattr(tool_result, "isError") and tool_result.isError:
-                    error_message = (
-                        result_text
-                        or f"Tool '{tool_name}' failed without specific error message."
-                    )
-                    await self.send_thought(
-                        f"Tool '{tool_name}' reported an error: {error_message}"
-                    )
-                    tool_result_payload = {"error": error_message}
-                else:
-                    await self.send_thought(
-                        f"Tool '{tool_name}' succeeded. Result snippet: {result_text[:15]}..."
-                    )  # Log snippet
-                    tool_result_payload = {"result": result_text}
+                i = j
+        await self.send_thought(
+            f"Finished executing tool call{'s' if len(function_calls)>1 else ''}."
+        )
+        return tool_response_parts
 
-            except Exception as e:
-                # Catch exceptions during the tool call itself
+    async def _call_tool(self, func_call: types.FunctionCall) -> types.Part:
+        tool_name = func_call.name
+        args = func_call.args if isinstance(func_call.args, dict) else {}
+        await self.send_thought(
+            f"Attempting to call '{tool_name}' with args '{args}'"
+        )
+
+        tool_result_payload: dict[str, Any]
+        try:
+            tool_result = await self.call_tool(tool_name, args)
+            await self.send_thought(
+                f"  Session tool '{tool_name}' execution finished."
+            )
+            result_text = ""
+            if (
+                hasattr(tool_result, "content")
+                and tool_result.content
+                and hasattr(tool_result.content[0], "text")
+            ):
+                result_text = tool_result.content[0].text or ""
+            if hasattr(tool_result, "isError") and tool_result.isError:
                 error_message = (
-                    f"Tool execution framework failed: {type(e).__name__}: {e}"
+                    result_text
+                    or f"Tool '{tool_name}' failed without specific error message."
                 )
                 await self.send_thought(
-                    f"Error executing tool '{tool_name}': {error_message}"
+                    f"Tool '{tool_name}' reported an error: {error_message}"
                 )
                 tool_result_payload = {"error": error_message}
-
-            # Create a FunctionResponse Part to send back to the model
-            tool_response_parts.append(
-                types.Part.from_function_response(
-                    name=tool_name, response=tool_result_payload
-                )
+            else:
+                await self.send_thought(
+                    f"Tool '{tool_name}' succeeded. Result snippet: {result_text[:15]}..."
+                )  # Log snippet
+                tool_result_payload = {"result": result_text}
+
+        except Exception as e:
+            # Catch exceptions during the tool call itself
+            error_message = (
+                f"Tool execution framework failed: {type(e).__name__}: {e}"
             )
-        await self.send_thought(
-            f"Finished executing tool call{'s' if len(function_calls)>1 else ''}."
+            await self.send_thought(
+                f"Error executing tool '{tool_name}': {error_message}"
+            )
+            tool_result_payload = {"error": error_message}
+
+        # Create a FunctionResponse Part to send back to the model
+        return types.Part.from_function_response(
+            name=tool_name, response=tool_result_payload
         )
-        return tool_response_parts
 
-    async def connect_to_server(self, server_script_path: str):
+    async def call_tool(self, name: str, arguments: dict):
+        """session.call_tool() on the least busy server process."""
+        i = min(range(len(self.sessions)), key=self.calls_in_flight.__getitem__)
+        self.calls_in_flight[i] += 1
+        try:
+            return await self.sessions[i].call_tool(name, arguments)
+        finally:
+            self.calls_in_flight[i] -= 1
+
+    async def connect_to_server(
+        self, server_script_path: str, processes: int = 1, env: Optional[dict] = None
+    ):
         """Connect to an MCP server
         Args:
             server_script_path: Path to the server script (.py or .js)
+            processes: Number of copies of the server to start
+            env: Extra environment variables for the server processes
         """
         if self.session is not None:
             return
@@ -118,48 +184,92 @@ class MCPClient:
 
         command = "python" if is_python else "node"
         server_params = StdioServerParameters(
-            command=command, args=[server_script_path], env=None
+            command=command,
+            args=[server_script_path],
+            env={**os.environ, **env} if env else None,
         )
-        stdio_transport = await self.exit_stack.enter_async_context(
-            stdio_client(server_params)
-        )
-        self.stdio, self.write = stdio_transport
-        self.session = await self.exit_stack.enter_async_context(
-            ClientSession(self.stdio, self.write)
-        )
-        await self.session.initialize()
+        for _ in range(processes):
+            read, write = await self.exit_stack.enter_async_context(
+                stdio_client(server_params)
+            )
+            session = await self.exit_stack.enter_async_context(
+                ClientSession(read, write, message_handler=self._handle_message)
+            )
+            await session.initialize()
+            self.sessions.append(session)
+            self.calls_in_flight.append(0)
+        self.session = self.sessions[0]
 
         # List available tools
-        response = await self.session.list_tools()
-        tools = response.tools
+        self.gemini_tools = None
+        tools = (await self._get_gemini_tools()).function_declarations
         print("\nConnected to server with tools:", [tool.name for tool in tools])
 
-    async def process_query(self, query: str) -> str:
-        """Process a query using Gemini and available tools"""
-        self.history += [types.Content(role="user", parts=[types.Part(text=query)])]
-
-        session_tool_list = await self.session.list_tools()
-        gemini_tool_config = types.Tool(
-            function_declarations=[
-                types.FunctionDeclaration(
-                    name=tool.name,
-                    description=tool.description,
-                    parameters=tool.inputSchema,  # Assumes inputSchema is compatible
-                )
+    async def _get_gemini_tools(self) -> types.Tool:
+        """The server's tools as Gemini function declarations, cached."""
+        if self.gemini_tools is None:
+            session_tool_list = await self.session.list_tools()
+            self.read_only_tools = {
+                tool.name
                 for tool in session_tool_list.tools
-            ]
+                if tool.annotations and tool.annotations.readOnlyHint
+            }
+            self.gemini_tools = types.Tool(
+                function_declarations=[
+                    types.FunctionDeclaration(
+                        name=tool.name,
+                        description=tool.description,
+                        parameters=tool.inputSchema,  # Assumes inputSchema is compatible
+                    )
+                    for tool in session_tool_list.tools
+                ]
+            )
+        return self.gemini_tools
+
+    async def _handle_message(self, message):
+        # Older mcp releases wrap notifications in a ServerNotification root model.
+        notification = getattr(message, "root", message)
+        if isinstance(notification, mcp_types.ToolListChangedNotification):
+            self.gemini_tools = None
+
+    def new_memory(self) -> ConversationMemory:
+        """An empty history for another conversation over this connection."""
+        return ConversationMemory(
+            HISTORY_TOKEN_BUDGET, HISTORY_RECENT_TURNS, summarize=self._summarize
         )
+
+    async def _summarize(self, previous_summary: str, transcript: str) -> str:
+        response = await self.genai_client.aio.models.generate_content(
+            model=self.model_id,
+            contents=f"Earlier summary:\n{previous_summary or '(none)'}\n\nConversation:\n{transcript}",
+            config=types.GenerateContentConfig(
+                temperature=TEMPERATURE, system_instruction=SUMMARY_PROMPT
+            ),
+        )
+        return response.text
+
+    async def process_query(
+        self, query: str, memory: Optional[ConversationMemory] = None
+    ) -> str:
+        """Process a query using Gemini and available tools, in the
+        conversation held by `memory` (self.memory by default). The caller
+        compacts `memory` after the turn, off the response path."""
+        memory = self.memory if memory is None else memory
+        memory.append(types.Content(role="user", parts=[types.Part(text=query)]))
+
+        gemini_tool_config = await self._get_gemini_tools()
         response = await self.genai_client.aio.models.generate_content(
             model=self.model_id,
-            contents=self.history,  # Send updated history
+            contents=memory.history,  # Send updated history
             config=types.GenerateContentConfig(
                 temperature=TEMPERATURE,
                 tools=[gemini_tool_config],
+                system_instruction=memory.system_instruction(),
             ),
         )
         if not response.candidates:
             return response.text
-        self.history.append(response.candidates[0].content)
+        memory.append(response.candidates[0].content)
 
         # --- 3. Tool Calling Loop ---
         turn_count = 0
@@ -188,7 +298,7 @@ class MCPClient:
 
             # --- 3.2 Add Tool Responses to History ---
             # Send back the results for *all* function calls from the previous turn
-            self.history.append(
+            memory.append(
                 types.Content(role="function", parts=tool_response_parts)
             )  # Use "function" role
             await self.send_thought(
@@ -201,10 +311,11 @@ class MCPClient:
             )
             response = await self.genai_client.aio.models.generate_content(
                 model=self.model_id,
-                contents=self.history,  # Send updated history
+                contents=memory.history,  # Send updated history
                 config=types.GenerateContentConfig(
                     temperature=TEMPERATURE,
                     tools=[gemini_tool_config],
+                    system_instruction=memory.system_instruction(),
                 ),
             )
             await self.send_thought("Subsequent response received.")
@@ -216,7 +327,7 @@ class MCPClient:
                 )
                 break  # Exit loop if no candidates are returned
             latest_content = response.candidates[0].content
-            self.history.append(latest_content)
+            memory.append(latest_content)
             has_function_calls = any(
                 part.function_call for part in latest_content.parts
             )
@@ -237,6 +348,57 @@ class MCPClient:
         print(response.text)
         return response.text
 
+    async def stream_query(
+        self, query: str, memory: Optional[ConversationMemory] = None
+    ) -> AsyncIterator[Optional[str]]:
+        """process_query(), yielding the model's text as it is generated, in
+        every turn including those after tool calls. None marks the start of a
+        new model turn after tool calls; the last turn is the final reply."""
+        memory = self.memory if memory is None else memory
+        memory.append(types.Content(role="user", parts=[types.Part(text=query)]))
+
+        gemini_tool_config = await self._get_gemini_tools()
+        turn_count = 0
+        while True:
+            text = ""
+            function_call_parts: list[types.Part] = []
+            stream = await self.genai_client.aio.models.generate_content_stream(
+                model=self.model_id,
+                contents=memory.history,
+                config=types.GenerateContentConfig(
+                    temperature=TEMPERATURE,
+                    tools=[gemini_tool_config],
+                    system_instruction=memory.system_instruction(),
+                ),
+            )
+            async for chunk in stream:
+                if not chunk.candidates or not chunk.candidates[0].content:
+                    continue
+                for part in chunk.candidates[0].content.parts or []:
+                    if part.function_call:
+                        function_call_parts.append(part)
+                    elif part.text:
+                        text += part.text
+                        yield part.text
+
+            # The streamed chunks, merged back into one model turn for the history.
+            parts = ([types.Part(text=text)] if text else []) + function_call_parts
+            if not parts:
+                await self.send_thought("Warning: model response has no content.")
+                break
+            memory.append(types.Content(role="model", parts=parts))
+            if not function_call_parts:
+                break
+
+            turn_count += 1
+            await self.send_thought(f"\n--- Tool Turn #{turn_count} ---")
+            tool_response_parts = await self._execute_tool_calls(
+                [part.function_call for part in function_call_parts]
+            )
+            memory.append(types.Content(role="function", parts=tool_response_parts))
+            yield None
+        await self.send_thought("Agent loop finished.")
+
     async def chat_loop(self):
         """Run an interactive chat loop. For testing at the command line."""
         print("\nMCP Client Started!")
@@ -251,6 +413,7 @@ class MCPClient:
 
                 response = await self.process_query(query)
                 print("\n" + response)
+                await self.memory.compact()
 
             except Exception as e:
                 print(f"\nError: {str(e)}")
@@ -258,6 +421,7 @@ class MCPClient:
     async def cleanup(self):
         """Clean up resources"""
         await self.exit_stack.aclose()
+        self.gemini_tools = None
 
 
 async def main():
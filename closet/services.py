@@ -2,6 +2,8 @@ import asyncio
 import os
 import logging
 from django.conf import settings
+from mirror.thoughts import thought_bus
+
 from .mcp_client import MCPClient  # Make sure this import path is correct
 
 logger = logging.getLogger(__name__)
@@ -13,8 +15,12 @@ class ClosetMCPService:
 
     def __init__(self):
         # This constructor should ideally only be called once via get_instance
-        self.client = MCPClient()
+        self.client = MCPClient(publish_thought=thought_bus.publish)
         self.is_connected = False
+        # Turns of the closet conversation run one at a time, and so do the
+        # compactions of its history that follow them.
+        self.conversation_lock = asyncio.Lock()
+        self.compactions: set[asyncio.Task] = set()
         # The AsyncExitStack is now part of MCPClient, which is good.
 
     @classmethod
@@ -52,6 +58,8 @@ class ClosetMCPService:
             logger.info("Shutting down MCP client...")
             await self.client.cleanup()  # MCPClient.cleanup() calls self.exit_stack.aclose()
             self.is_connected = False
+            for task in self.compactions:
+                task.cancel()
             logger.info("MCP client shut down successfully.")
 
     async def process_query(self, query: str) -> str:
@@ -65,7 +73,26 @@ class ClosetMCPService:
             )
 
         # The process_query method in MCPClient will use the existing session
-        return await self.client.process_query(query)
+        async with self.conversation_lock:
+            try:
+                return await self.client.process_query(query)
+            finally:
+                self._compact_later()
+
+    def _compact_later(self):
+        """Compact the history (which may ask Gemini for a summary) in the
+        background, so the next turn waits for it instead of this reply."""
+
+        async def compact():
+            async with self.conversation_lock:
+                try:
+                    await self.client.memory.compact()
+                except Exception as e:
+                    logger.error(f"Compacting conversation history failed: {e}", exc_info=True)
+
+        task = asyncio.create_task(compact())
+        self.compactions.add(task)
+        task.add_done_callback(self.compactions.discard)
 
 
 # This function will be used by views to get the service instance
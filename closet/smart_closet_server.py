@@ -1,6 +1,7 @@
 import os
 from typing import List, Literal, Optional
 from mcp.server.fastmcp import FastMCP
+from mcp.types import ToolAnnotations
 
 #from database_functions import add_outfit_suggestion
 
@@ -25,6 +26,7 @@ CLOTHING_CATEGORIES = ["Tops", "Pants", "Skirts", "Dresses", "Shoes", "Outerwear
         "If 'category' is not None, will filter the inventory for that category before querying. "
         "If all parameters are None, the entire closet is returned."
     ),
+    annotations=ToolAnnotations(readOnlyHint=True),
 )   
 async def query_closet(query: Optional[str]=None, top_k: Optional[int] = None, category: Optional[Literal[tuple(CLOTHING_CATEGORIES)]] = None):
     # TODO use embedding distance to get top k
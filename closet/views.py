@@ -123,7 +123,7 @@ async def voice_chat(request):
                         status=500,
                     )
 
-                tool_result = await mcp_service.client.session.call_tool(
+                tool_result = await mcp_service.client.call_tool(
                     tool_name, parameters
                 )
 
@@ -0,0 +1,136 @@
+# mirror/memory.py
+"""Bounded conversation history for MCPClient.
+
+Every Gemini call re-sends the whole history, tool results included, so on a
+mirror that runs for weeks the prompt (and the latency) would grow without
+bound. ConversationMemory keeps the most recent turns verbatim, replaces the
+tool results of older turns with short stubs, and once the history exceeds its
+token budget folds the older turns into a running summary that is sent as the
+system instruction.
+"""
+import json
+import logging
+from typing import Awaitable, Callable, Optional
+
+from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+# Rough size of a Gemini token in characters of English text or JSON. Counting
+# locally keeps compaction off the network; the budget only needs to be close.
+CHARS_PER_TOKEN = 4
+# Characters of each line kept when turns are folded without a summarizer.
+FALLBACK_LINE_CHARS = 200
+
+
+def _part_text(part: types.Part) -> str:
+    if part.text:
+        return part.text
+    if part.function_call:
+        args = json.dumps(part.function_call.args or {}, default=str)
+        return f"{part.function_call.name}({args})"
+    if part.function_response:
+        response = json.dumps(part.function_response.response or {}, default=str)
+        return f"{part.function_response.name} -> {response}"
+    return ""
+
+
+def estimate_tokens(contents: list[types.Content]) -> int:
+    chars = sum(
+        len(_part_text(part)) for content in contents for part in content.parts or []
+    )
+    return chars // CHARS_PER_TOKEN
+
+
+def render(contents: list[types.Content]) -> str:
+    """The turns as plain "role: text" lines, for the summarizer."""
+    return "\n".join(
+        f"{content.role}: {_part_text(part)}"
+        for content in contents
+        for part in content.parts or []
+        if _part_text(part)
+    )
+
+
+class ConversationMemory:
+    """The history sent to Gemini, kept within `token_budget` tokens.
+
+    A turn starts at a "user" content (the query) and runs through the model
+    and "function" contents answering it, so tool calls and their responses
+    are never separated. Call compact() between turns.
+    """
+
+    def __init__(
+        self,
+        token_budget: int,
+        recent_turns: int,
+        summarize: Optional[Callable[[str, str], Awaitable[str]]] = None,
+    ):
+        self.token_budget = token_budget
+        self.recent_turns = recent_turns
+        # async summarize(previous_summary, rendered_turns) -> new summary.
+        self.summarize = summarize
+        self.history: list[types.Content] = []
+        self.summary = ""
+
+    def append(self, content: types.Content):
+        self.history.append(content)
+
+    def system_instruction(self) -> Optional[str]:
+        if not self.summary:
+            return None
+        return f"Summary of the earlier conversation with the user:\n{self.summary}"
+
+    def tokens(self) -> int:
+        return estimate_tokens(self.history) + len(self.summary) // CHARS_PER_TOKEN
+
+    def _turn_starts(self) -> list[int]:
+        return [i for i, content in enumerate(self.history) if content.role == "user"]
+
+    def _stub_tool_results(self, end: int):
+        """Replace the tool results in history[:end] with stubs. The model
+        keeps its own answers from those turns and can call the tool again."""
+        for content in self.history[:end]:
+            if content.role != "function":
+                continue
+            content.parts = [
+                types.Part.from_function_response(
+                    name=part.function_response.name,
+                    response={"stub": "Earlier result omitted; call the tool again if needed."},
+                )
+                if part.function_response and "stub" not in (part.function_response.response or {})
+                else part
+                for part in content.parts or []
+            ]
+
+    async def compact(self):
+        starts = self._turn_starts()
+        if len(starts) > self.recent_turns:
+            self._stub_tool_results(starts[-self.recent_turns])
+        if self.tokens() <= self.token_budget or len(starts) < 2:
+            return
+        # Fold everything but the recent turns, or, if those alone are over
+        # budget, everything but the last one.
+        keep = starts[-self.recent_turns] if len(starts) > self.recent_turns else 0
+        if keep == 0 or estimate_tokens(self.history[keep:]) > self.token_budget:
+            keep = starts[-1]
+        transcript = render(self.history[:keep])
+        try:
+            if self.summarize is None:
+                raise RuntimeError("no summarizer")
+            summary = await self.summarize(self.summary, transcript)
+            if not summary:  # e.g. a blocked or empty Gemini reply
+                raise RuntimeError("empty summary")
+        except Exception as e:
+            logger.warning(f"Summarizing conversation history failed ({e}); clipping it instead.")
+            lines = [line[:FALLBACK_LINE_CHARS] for line in transcript.split("\n")]
+            summary = "\n".join(filter(None, [self.summary, *lines]))
+        # A summary that itself outgrows half the budget keeps only its tail.
+        max_chars = self.token_budget * CHARS_PER_TOKEN // 2
+        # Drop the folded turns only now that their summary is in place.
+        self.summary = summary[-max_chars:]
+        del self.history[:keep]
+        logger.info(
+            f"Folded {keep} history entries into the summary; "
+            f"history is now ~{self.tokens()} tokens."
+        )
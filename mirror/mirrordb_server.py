@@ -5,6 +5,7 @@ import uuid
 import functools
 import json
 import os
+import pickle
 import pytz
 import re
 import sys
@@ -68,11 +69,44 @@ class Status(str, Enum):
     IN_PROGRESS = "In progress"
 
 
-cache = {
-    "habits": {},
-    "events": {},
-    "tasks": {},
-}
+class SharedCache:
+    """The id -> entity maps the tools hand out ids from ("tasks", "habits",
+    "events"), so later calls can refer to an entity by its short id.
+
+    MCPService may run several copies of this server and send each call to
+    any of them. It then sets MIRRORDB_CACHE_DIR to a private directory where
+    each map is a pickle file, replaced whole and atomically, and read back on
+    every lookup: an id handed out by one server resolves in all of them, and
+    the most recent refresh wins, as it does within one server. Without it
+    the maps live in this process. Maps are only ever assigned, never changed
+    in place.
+    """
+
+    def __init__(self, directory, keys):
+        self.directory = directory
+        self.maps = {key: {} for key in keys}
+
+    def __getitem__(self, key):
+        if self.directory is None:
+            return self.maps[key]
+        try:
+            with open(os.path.join(self.directory, f"{key}.pickle"), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def __setitem__(self, key, value):
+        if self.directory is None:
+            self.maps[key] = value
+            return
+        path = os.path.join(self.directory, f"{key}.pickle")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(value, f)
+        os.replace(tmp, path)
+
+
+cache = SharedCache(os.getenv("MIRRORDB_CACHE_DIR"), ["habits", "events", "tasks"])
 
 
 def parse_url(url):
@@ -127,20 +161,27 @@ def get_now():
 
 
 mcp = FastMCP("SmartMirror BackendDB FastMCP")
+# Tools that only read. The client may run several of these concurrently, so
+# they do their blocking Notion / Google Calendar I/O in a thread.
+READ_ONLY = types.ToolAnnotations(readOnlyHint=True)
 
 
-@mcp.tool(description="Gets the user's local time zone.")
+@mcp.tool(description="Gets the user's local time zone.", annotations=READ_ONLY)
 async def get_time_zone() -> dict:
     return "America/New_York"
 
 
-@mcp.tool(description="Gets the current date and time in the user's local time zone.")
+@mcp.tool(
+    description="Gets the current date and time in the user's local time zone.",
+    annotations=READ_ONLY,
+)
 async def get_current_datetime() -> dict:
     return get_now()
 
 
 @mcp.tool(
-    description="Returns any tasks that are not complete (or have subtasks that are) not complete on or before the specified date."
+    description="Returns any tasks that are not complete (or have subtasks that are) not complete on or before the specified date.",
+    annotations=READ_ONLY,
 )
 async def tasks_on_or_before(on_or_before_date: str):
     return await get_tasks(on_or_before_date)
@@ -149,6 +190,7 @@ async def tasks_on_or_before(on_or_before_date: str):
 @mcp.tool(
     name="get_active_tasks",
     description="Returns active tasks, defined as tasks that are (or have subtasks that are) not complete and due on or before the current date.",
+    annotations=READ_ONLY,
 )
 async def current_tasks():
     return await get_tasks()
@@ -159,7 +201,9 @@ async def get_tasks(on_or_before_date=None):
     if on_or_before_date is None:
         on_or_before_date = get_today()
     notion = Client(auth=NOTION_API_KEY)
-    notion_tasks = get_notion_tasks(notion, NOTION_TASK_DB, on_or_before_date)
+    notion_tasks = await asyncio.to_thread(
+        get_notion_tasks, notion, NOTION_TASK_DB, on_or_before_date
+    )
     flattened_tasks = {}
     task_counter = 1
     for task_data in notion_tasks:
@@ -202,6 +246,7 @@ def clean_dict(dict_, ignore_keys):
 @mcp.tool(
     name="get_daily_habits",
     description="Returns the completion status of habits for today's date.",
+    annotations=READ_ONLY,
 )
 async def get_habits():
     global cache
@@ -211,7 +256,9 @@ async def get_habits():
     for emoji, time in zip(
         ["☀️", "🌙", "🌸", "✨"], ["Morning", "Evening", "Daily", "Weekly"]
     ):
-        habit_group = fetch_habit_group(notion, emoji, NOTION_HABIT_DB)
+        habit_group = await asyncio.to_thread(
+            fetch_habit_group, notion, emoji, NOTION_HABIT_DB
+        )
         for habit in habit_group:
             habit["timeofday"] = f"{emoji} {time}"
             habit["habit_id"] = str(count)
@@ -222,7 +269,8 @@ async def get_habits():
 
 
 @mcp.tool(
-    description="Returns the user's calendar events occuring on the specified date."
+    description="Returns the user's calendar events occuring on the specified date.",
+    annotations=READ_ONLY,
 )
 async def events_on(date):
     events = await get_events(date)
@@ -231,6 +279,7 @@ async def events_on(date):
 
 @mcp.tool(
     description="Returns the user's calendar events starting and ending between the specified dates.",
+    annotations=READ_ONLY,
 )
 async def events_between(start_date, end_date):
     return await get_events(start_date, end_date)
@@ -239,6 +288,7 @@ async def events_between(start_date, end_date):
 @mcp.tool(
     name="get_todays_events",
     description="Returns the user's calendar events for today's date.",
+    annotations=READ_ONLY,
 )
 async def todays_events():
     return await get_events()
@@ -259,11 +309,15 @@ async def get_events(start_date=None, end_date=None):
     )
     calendar_ids = GOOGLE_CALENDAR_IDS
     count = 0
-    events = get_google_calendar_events(creds, calendar_ids, start_date, end_date)
+    events = await asyncio.to_thread(
+        get_google_calendar_events, creds, calendar_ids, start_date, end_date
+    )
+    cached_events = cache["events"]
     for i, e in enumerate(events):
         e["event_id"] = i
-        cache["events"][i] = e
-    events = clean_events(cache["events"])
+        cached_events[i] = e
+    cache["events"] = cached_events
+    events = clean_events(cached_events)
     return {
         "function_called": "get_events",
         "events": events,
@@ -1,12 +1,37 @@
 # mirror/services.py
 import asyncio
+import json
 import os
 import logging
+import shutil
+import tempfile
+from collections import OrderedDict
+from typing import AsyncIterator, Optional
+
 from django.conf import settings
 from .mcp_client import MCPClient  # Make sure this import path is correct
+from .memory import ConversationMemory
+from .thoughts import DEFAULT_CONVERSATION, current_conversation, thought_bus
 
 logger = logging.getLogger(__name__)
 
+# Conversations whose history is kept; the least recently used idle one is
+# dropped beyond this.
+MAX_CONVERSATIONS = int(os.getenv("MCP_MAX_CONVERSATIONS", "32"))
+# Copies of mirrordb_server.py to run; each tool call goes to the least busy,
+# so a slow call (or one waiting for the user's confirmation) doesn't hold up
+# the others.
+SERVER_PROCESSES = int(os.getenv("MCP_SERVER_PROCESSES", "2"))
+
+
+class Conversation:
+    """One conversation with the agent. Its turns run one at a time; turns of
+    different conversations run concurrently over the shared MCP session."""
+
+    def __init__(self, memory: ConversationMemory):
+        self.memory = memory
+        self.lock = asyncio.Lock()
+
 
 class MCPService:
     _instance = None
@@ -14,8 +39,13 @@ class MCPService:
 
     def __init__(self):
         # This constructor should ideally only be called once via get_instance
-        self.client = MCPClient()
+        self.client = MCPClient(publish_thought=thought_bus.publish)
         self.is_connected = False
+        self.conversations: OrderedDict[str, Conversation] = OrderedDict()
+        # Compactions running after their turn's reply has gone out.
+        self.compactions: set[asyncio.Task] = set()
+        # Where the server processes share their id -> entity cache.
+        self.cache_dir = None
         # The AsyncExitStack is now part of MCPClient, which is good.
 
     @classmethod
@@ -36,7 +66,13 @@ class MCPService:
             try:
                 # The connect_to_server method in your MCPClient already handles
                 # entering the async contexts for stdio_client and ClientSession.
-                await self.client.connect_to_server(server_script_path)
+                env = None
+                if SERVER_PROCESSES > 1:
+                    self.cache_dir = tempfile.mkdtemp(prefix="mirrordb-cache-")
+                    env = {"MIRRORDB_CACHE_DIR": self.cache_dir}
+                await self.client.connect_to_server(
+                    server_script_path, processes=SERVER_PROCESSES, env=env
+                )
                 self.is_connected = True  # Set based on successful connection
                 logger.info("MCP client connected successfully.")
             except Exception as e:
@@ -53,9 +89,48 @@ class MCPService:
             logger.info("Shutting down MCP client...")
             await self.client.cleanup()  # MCPClient.cleanup() calls self.exit_stack.aclose()
             self.is_connected = False
+            for task in self.compactions:
+                task.cancel()
+            if self.cache_dir is not None:
+                shutil.rmtree(self.cache_dir, ignore_errors=True)
+                self.cache_dir = None
             logger.info("MCP client shut down successfully.")
 
-    async def process_query(self, query: str) -> str:
+    def _conversation(self, conversation_id: str) -> Conversation:
+        conversation = self.conversations.get(conversation_id)
+        if conversation is None:
+            conversation = Conversation(self.client.new_memory())
+            self.conversations[conversation_id] = conversation
+            idle = [
+                key
+                for key, other in self.conversations.items()
+                if not other.lock.locked() and key != conversation_id
+            ]
+            for key in idle[: max(0, len(self.conversations) - MAX_CONVERSATIONS)]:
+                del self.conversations[key]
+                thought_bus.discard(key)
+        self.conversations.move_to_end(conversation_id)
+        return conversation
+
+    def _compact_later(self, conversation: Conversation):
+        """Compact the conversation's history (which may ask Gemini for a
+        summary) in the background, holding its lock so the next turn waits
+        for it instead of the reply to this one."""
+
+        async def compact():
+            async with conversation.lock:
+                try:
+                    await conversation.memory.compact()
+                except Exception as e:
+                    logger.error(f"Compacting conversation history failed: {e}", exc_info=True)
+
+        task = asyncio.create_task(compact())
+        self.compactions.add(task)
+        task.add_done_callback(self.compactions.discard)
+
+    async def process_query(
+        self, query: str, conversation_id: str = DEFAULT_CONVERSATION
+    ) -> str:
         if not self.client.session or not self.is_connected:
             # If not connected, you might try a one-off reconnect here,
             # but it's generally better to ensure it's connected at startup
@@ -66,7 +141,34 @@ class MCPService:
             )
 
         # The process_query method in MCPClient will use the existing session
-        return await self.client.process_query(query)
+        conversation = self._conversation(conversation_id)
+        async with conversation.lock:
+            token = current_conversation.set(conversation_id)
+            try:
+                return await self.client.process_query(query, conversation.memory)
+            finally:
+                current_conversation.reset(token)
+                self._compact_later(conversation)
+
+    async def stream_query(
+        self, query: str, conversation_id: str = DEFAULT_CONVERSATION
+    ) -> AsyncIterator[Optional[str]]:
+        """process_query(), yielding the agent's text as it is generated; None
+        marks the start of a new model turn (see MCPClient.stream_query)."""
+        if not self.client.session or not self.is_connected:
+            logger.error("MCP Client is not connected. Query processing aborted.")
+            raise Exception(
+                "MCP Client is not connected. Please ensure the service is running."
+            )
+        conversation = self._conversation(conversation_id)
+        async with conversation.lock:
+            token = current_conversation.set(conversation_id)
+            try:
+                async for text in self.client.stream_query(query, conversation.memory):
+                    yield text
+            finally:
+                current_conversation.reset(token)
+                self._compact_later(conversation)
 
 
 # This function will be used by views to get the service instance
@@ -84,3 +186,49 @@ async def get_mcp_service():
             )
             raise  # Fail if on-demand connection doesn't work
     return service
+
+
+def format_agent_response(response_text: str) -> dict:
+    """Shape the agent's final text into the payload the chat UI expects.
+
+    Shared by the /voice/chat view and the ASR websocket, which forwards voice
+    transcripts to the agent in-process.
+    """
+    try:
+        # Attempt to parse the response. If it's a JSON from our MCP tool (e.g., confirmation_required),
+        # it means Gemini decided the tool's direct JSON output was the answer.
+        parsed_tool_response = json.loads(response_text)
+    except json.JSONDecodeError:
+        # It's a natural language response from Gemini, not a direct JSON from our tools.
+        return {
+            "response": [
+                r.strip() for r in response_text.strip().split("\n") if len(r.strip()) > 0
+            ]
+        }
+
+    if (
+        isinstance(parsed_tool_response, dict)
+        and parsed_tool_response.get("status") == "confirmation_required"
+    ):
+        return {
+            "needs_confirmation": True,
+            "action_details": parsed_tool_response.get("action_details"),
+            "response": [
+                parsed_tool_response.get("action_details", {}).get(
+                    "description", "Please confirm this action."
+                )
+            ],
+        }
+    # If a tool ran successfully without confirmation (e.g. get_tasks) and Gemini returned its JSON:
+    if isinstance(parsed_tool_response, dict) and (
+        parsed_tool_response.get("status") == "success"
+        or parsed_tool_response.get("status") == "error"
+    ):
+        return {
+            "response": [parsed_tool_response.get("message", "Action processed.")],
+            "updated_data": parsed_tool_response.get(
+                "updated_data"
+            ),  # For get_tasks, get_habits etc.
+        }
+    # It was valid JSON but not in our expected tool format. Treat as plain text from Gemini.
+    return {"response": str(response_text).split("\n")}
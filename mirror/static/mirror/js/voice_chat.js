@@ -1,3 +1,45 @@
+// === ASR wire format ===
+// The mic is captured at 16 kHz so the server does not have to resample, and
+// sent as 'pcm16' (32 KB/s) or 'mulaw' (16 KB/s, telephone quality).
+const ASR_SAMPLE_RATE = 16000;
+const ASR_ENCODING = 'pcm16';
+
+function floatToInt16(floatData) {
+    const int16 = new Int16Array(floatData.length);
+    for (let i = 0; i < floatData.length; i++) {
+        let s = Math.max(-1, Math.min(1, floatData[i]));
+        int16[i] = s < 0 ? s * 0x8000 : s * 0x7FFF;
+    }
+    return int16;
+}
+
+// G.711 mu-law, the inverse of MULAW_TABLE in ml_models/codecs.py
+function int16ToMulaw(int16) {
+    const out = new Uint8Array(int16.length);
+    for (let i = 0; i < int16.length; i++) {
+        let sample = int16[i];
+        const sign = (sample >> 8) & 0x80;
+        if (sign) sample = -sample;
+        sample = Math.min(sample, 32635) + 0x84;
+        let exponent = 7;
+        for (let mask = 0x4000; (sample & mask) === 0 && exponent > 0; mask >>= 1) {
+            exponent--;
+        }
+        const mantissa = (sample >> (exponent + 3)) & 0x0F;
+        out[i] = ~(sign | (exponent << 4) | mantissa) & 0xFF;
+    }
+    return out;
+}
+
+function encodeAudio(floatData) {
+    const int16 = floatToInt16(floatData);
+    return ASR_ENCODING === 'mulaw' ? int16ToMulaw(int16) : int16;
+}
+
+// Identifies this page's conversation with the agent, so other tabs and
+// devices keep separate histories. (crypto.randomUUID needs https.)
+const CONVERSATION_ID = Date.now().toString(36) + Math.random().toString(36).slice(2);
+
 // === Chat UI Handler ===
 function initializeChatUI({
     chatWindowId = 'chat-window',
@@ -14,6 +56,7 @@ function initializeChatUI({
         bubble[isRawHtml ? 'innerHTML' : 'textContent'] = messageText;
         chatWindow.appendChild(bubble);
         chatWindow.scrollTop = chatWindow.scrollHeight;
+        return bubble;
     }
 
     return { addMessageToChat };
@@ -125,7 +168,7 @@ function hideThoughtBubble() {
 async function pollForThoughts() {
     let data = null;
     try {
-        const response = await fetch(`/api/get_pending_thoughts`);
+        const response = await fetch(`/api/get_pending_thoughts?conversation=${CONVERSATION_ID}`);
         data = await response.json();
         console.log(data)
         if (data && data.thoughts) {
@@ -163,15 +206,26 @@ document.addEventListener('DOMContentLoaded', () => {
     const chatForm = document.getElementById('chat-form');
     const chatInput = document.getElementById('chat-input');
     const uiHandler = initializeChatUI({ chatWindowId: 'chat-window' });
+    const chatWindow = document.getElementById('chat-window');
     const micBtn      = document.getElementById('btn-mic');
     const autosendChk = document.getElementById('autosend-checkbox');
 
     // State holders
     let audioContext, processor, sourceNode, mediaStream, socket;
     let listening = false;
-
-    async function sendHttpRequest(payload) {
-        const resp = await fetch('chat', {
+    let transcriptBase = '';
+    let commandHandled = false;
+    // Two-pass ASR: the first transcript may be a draft that a
+    // transcript_correction replaces; auto-send then waits for the utterance to end.
+    let draftBubble = null;
+    let submitWhenFinal = false;
+    // The agent's reply as it is being generated; replaced by the final reply.
+    let streamBubble = null;
+
+    // POST to chat/stream, which answers with one JSON object per line:
+    // "delta" objects as the agent writes, then the "final" reply.
+    async function sendStreamingRequest(payload, onDelta) {
+        const resp = await fetch('chat/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -179,29 +233,70 @@ document.addEventListener('DOMContentLoaded', () => {
             },
             body: JSON.stringify(payload)
         });
-        return await resp.json();
+        if (!resp.ok) return await resp.json();
+        const reader = resp.body.getReader();
+        const decoder = new TextDecoder();
+        let buffered = '';
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffered += decoder.decode(value, { stream: true });
+            const lines = buffered.split('\n');
+            buffered = lines.pop();
+            for (const line of lines) {
+                if (!line) continue;
+                const msg = JSON.parse(line);
+                if (msg.type === 'delta') {
+                    onDelta(msg.text);
+                } else if (msg.type === 'final') {
+                    return msg;
+                }
+            }
+        }
+        return { error: 'The reply ended unexpectedly.' };
+    }
+
+    function appendAgentText(text) {
+        if (!streamBubble) streamBubble = uiHandler.addMessageToChat('', 'bot');
+        streamBubble.textContent += text;
+        chatWindow.scrollTop = chatWindow.scrollHeight;
     }
 
+    // Same bubbles and polling for a typed message and for a voice turn the
+    // ASR socket forwarded to the agent itself.
+    function startAgentTurn(text) {
+        const bubble = uiHandler.addMessageToChat(text, 'user');
+        chatInput.value = '';
+        startPolling(uiHandler.addMessageToChat);
+        startThoughtPolling();
+        return bubble;
+    }
+
+    function finishAgentTurn(data) {
+        if (streamBubble) {
+            streamBubble.remove();
+            streamBubble = null;
+        }
+        if (data.response && Array.isArray(data.response)) {
+            data.response.forEach(r => uiHandler.addMessageToChat(r, 'bot'));
+        } else if (data.error) {
+            uiHandler.addMessageToChat(`Error: ${data.error}`, 'bot error');
+        }
+        stopPolling();
+        stopThoughtPolling();
+    }
 
     async function submitChatForm() {
         const text = chatInput.value.trim();
         if (!text) return;
-        uiHandler.addMessageToChat(text, 'user');
-        chatInput.value = '';
+        startAgentTurn(text);
         try {
-            startPolling(uiHandler.addMessageToChat);
-            startThoughtPolling();
-            const data = await sendHttpRequest({ message: text });
-            if (data.response && Array.isArray(data.response)) {
-                data.response.forEach(r => uiHandler.addMessageToChat(r, 'bot'));
-            }
-            stopPolling();
-            stopThoughtPolling();
+            finishAgentTurn(await sendStreamingRequest(
+                { message: text, conversation_id: CONVERSATION_ID }, appendAgentText
+            ));
         } catch (err) {
             console.error('Chat error:', err);
-            uiHandler.addMessageToChat(`Error: ${err}`, 'bot error');
-            stopPolling();
-            stopThoughtPolling();
+            finishAgentTurn({ error: err });
         }
     }
 
@@ -210,59 +305,51 @@ document.addEventListener('DOMContentLoaded', () => {
         submitChatForm();
     });
 
+    chatInput.dataset.placeholder = chatInput.placeholder;
+
   micBtn.addEventListener('click', async () => {
     if (!listening) {
       // —— START RECORDING ——
       mediaStream = await navigator.mediaDevices.getUserMedia({ audio: true });
-      audioContext = new AudioContext();
+      // Browsers resample the mic to the context rate; fall back to the native
+      // rate (and server-side resampling) where a fixed rate isn't supported.
+      try {
+        audioContext = new AudioContext({ sampleRate: ASR_SAMPLE_RATE });
+      } catch (error) {
+        audioContext = new AudioContext();
+      }
       processor    = audioContext.createScriptProcessor(4096, 1, 1);
       sourceNode   = audioContext.createMediaStreamSource(mediaStream);
       sourceNode.connect(processor);
       processor.connect(audioContext.destination);
 
-      // Open ASR WebSocket
-      socket = new WebSocket(
-        (location.protocol === 'https:' ? 'wss://' : 'ws://') +
-        location.host +
-        '/ws/asr/'
-      );
-      socket.binaryType = 'arraybuffer';
-      socket.onopen = () => {
-        socket.send(JSON.stringify({
-          type:       'audio_config',
-          sampleRate: audioContext.sampleRate
-        }));
-      };
-      socket.onmessage = ev => {
-        const msg = JSON.parse(ev.data);
-        if (msg.type === 'transcript') {
-          const t = msg.transcript.trim();
-          // append or set
-          chatInput.value = chatInput.value
-            ? chatInput.value.trim() + ' ' + t
-            : t;
-          chatInput.dispatchEvent(new Event('input', { bubbles: true }));
-          console.log(autosendChk.checked);
-          if (autosendChk.checked) {
-            submitChatForm();
-          }
-        } else if (msg.error) {
-          console.error('ASR error:', msg.error);
-        }
-      };
-      socket.onerror = e => console.error('WebSocket error', e);
-      socket.onclose = e => console.log('WebSocket closed', e.code);
+      transcriptBase = chatInput.value.trim();
+      commandHandled = false;
+      const config = JSON.stringify({
+        type:       'audio_config',
+        sampleRate: audioContext.sampleRate,
+        encoding:   ASR_ENCODING,
+        partials:   true,
+        // keep the socket open between utterances (see end_utterance below)
+        persistent: true,
+        // the server ends the utterance on trailing silence, no button needed
+        endpointing: true,
+        // with auto-send on, the server forwards the transcript to the agent
+        agent:      autosendChk.checked && !transcriptBase,
+        conversation: CONVERSATION_ID
+      });
+      if (socket && socket.readyState === WebSocket.OPEN) {
+        // Reuse the session: no new handshake, just this utterance's config.
+        socket.send(config);
+      } else {
+        openAsrSocket(config);
+      }
 
       // Stream PCM chunks
       processor.onaudioprocess = e => {
-        const floatData = e.inputBuffer.getChannelData(0);
-        const int16     = new Int16Array(floatData.length);
-        for (let i = 0; i < floatData.length; i++) {
-          let s = Math.max(-1, Math.min(1, floatData[i]));
-          int16[i] = s < 0 ? s * 0x8000 : s * 0x7FFF;
-        }
+        const encoded = encodeAudio(e.inputBuffer.getChannelData(0));
         try {
-            socket.send(int16.buffer);
+            socket.send(encoded.buffer);
         } catch (error) {
             console.log("Process chunk error, probably stopped");
             console.log(error);
@@ -273,7 +360,16 @@ document.addEventListener('DOMContentLoaded', () => {
       micBtn.classList.add('recording');
 
     } else {
-      // —— STOP RECORDING ——
+      await stopRecording(true);
+    }
+  });
+
+  // —— STOP RECORDING ——
+  // sendEnd is false when the server already detected the end of speech.
+  async function stopRecording(sendEnd) {
+      if (!listening) return;
+      listening = false;
+      micBtn.classList.remove('recording');
       processor.disconnect();
       sourceNode.disconnect();
       await audioContext.close();
@@ -281,16 +377,96 @@ document.addEventListener('DOMContentLoaded', () => {
       // **Stop all mic tracks** so the browser releases the mic
       mediaStream.getTracks().forEach(track => track.stop());
 
-      // Tell server we're done
+      // Tell server the utterance is done; the socket stays open for the next
+      if (sendEnd) {
         try {
-            socket.send(JSON.stringify({ type: 'end_stream' }));
+            socket.send(JSON.stringify({ type: 'end_utterance' }));
         } catch (error) {
             console.log("Process chunk error, probably stopped");
             console.log(error);
         }
+      }
+  }
 
-      listening = false;
-      micBtn.classList.remove('recording');
-    }
-  });
+  function openAsrSocket(config) {
+      socket = new WebSocket(
+        (location.protocol === 'https:' ? 'wss://' : 'ws://') +
+        location.host +
+        '/ws/asr/'
+      );
+      socket.binaryType = 'arraybuffer';
+      socket.onopen = () => socket.send(config);
+      socket.onmessage = ev => {
+        const msg = JSON.parse(ev.data);
+        if (msg.status === 'warming_up') {
+          chatInput.placeholder = 'Speech model is warming up, keep talking…';
+        } else if (msg.status === 'ready') {
+          chatInput.placeholder = chatInput.dataset.placeholder;
+        } else if (msg.type === 'partial_transcript') {
+          // show the draft after whatever was typed before recording started
+          const t = msg.transcript.trim();
+          chatInput.value = transcriptBase ? transcriptBase + ' ' + t : t;
+        } else if (msg.type === 'command') {
+          // A spoken yes/no answers the open confirmation directly,
+          // without going through the chat and the LLM.
+          const actionId = currentActiveConfirmationActionId;
+          if (actionId && (msg.command === 'confirm' || msg.command === 'deny')) {
+            handleUiDecision(actionId, msg.command === 'confirm');
+            commandHandled = true;
+          }
+        } else if (msg.type === 'transcript') {
+          if (commandHandled) {
+            commandHandled = false;
+            chatInput.value = transcriptBase;
+            return;
+          }
+          const t = msg.transcript.trim();
+          if (msg.agent) {
+            const bubble = startAgentTurn(t);
+            if (msg.draft) draftBubble = bubble;
+            return;
+          }
+          // append or set
+          chatInput.value = transcriptBase ? transcriptBase + ' ' + t : t;
+          chatInput.dispatchEvent(new Event('input', { bubbles: true }));
+          console.log(autosendChk.checked);
+          if (msg.draft) {
+            submitWhenFinal = autosendChk.checked;
+          } else if (autosendChk.checked) {
+            submitChatForm();
+          }
+        } else if (msg.type === 'transcript_correction') {
+          const t = msg.transcript.trim();
+          if (draftBubble) {
+            draftBubble.textContent = t;
+          } else {
+            chatInput.value = transcriptBase ? transcriptBase + ' ' + t : t;
+          }
+        } else if (msg.type === 'agent_delta') {
+          appendAgentText(msg.text);
+        } else if (msg.type === 'agent_response') {
+          finishAgentTurn(msg);
+        } else if (msg.type === 'endpoint') {
+          stopRecording(false);
+        } else if (msg.type === 'utterance_complete') {
+          finishUtterance();
+        } else if (msg.error) {
+          console.error('ASR error:', msg.error);
+        }
+      };
+      socket.onerror = e => console.error('WebSocket error', e);
+      socket.onclose = e => {
+        console.log('WebSocket closed', e.code);
+        finishUtterance();
+      };
+  }
+
+  // The final text of an utterance is in: send a draft that was held back.
+  function finishUtterance() {
+      draftBubble = null;
+      if (submitWhenFinal) {
+        submitWhenFinal = false;
+        submitChatForm();
+      }
+  }
 });
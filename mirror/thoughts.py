@@ -0,0 +1,43 @@
+# mirror/thoughts.py
+"""In-process publish/subscribe channel for the agent's "thoughts".
+
+MCPClient publishes progress messages while it works through a query and the
+chat page polls them from get_pending_thoughts. When the client runs inside
+the Django process (MCPService), it publishes here directly instead of POSTing
+to /api/add_thought; that endpoint remains for clients in another process.
+"""
+import asyncio
+from collections import defaultdict
+from contextvars import ContextVar
+
+DEFAULT_CONVERSATION = "default"
+# Conversation the running agent turn belongs to (set by MCPService), so the
+# client's thoughts reach that conversation's page without passing it around.
+current_conversation: ContextVar[str] = ContextVar(
+    "current_conversation", default=DEFAULT_CONVERSATION
+)
+
+
+class ThoughtBus:
+    """One unbounded asyncio.Queue per conversation. publish() never blocks,
+    so the agent loop doesn't wait on the UI."""
+
+    def __init__(self):
+        self.queues: dict[str, asyncio.Queue] = defaultdict(asyncio.Queue)
+
+    def publish(self, thought: str, conversation: str | None = None):
+        self.queues[conversation or current_conversation.get()].put_nowait(thought)
+
+    def drain(self, conversation: str = DEFAULT_CONVERSATION) -> list[str]:
+        """Return and remove every pending thought of the conversation."""
+        queue = self.queues.get(conversation)
+        thoughts = []
+        while queue is not None and not queue.empty():
+            thoughts.append(queue.get_nowait())
+        return thoughts
+
+    def discard(self, conversation: str):
+        self.queues.pop(conversation, None)
+
+
+thought_bus = ThoughtBus()
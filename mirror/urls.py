@@ -15,6 +15,8 @@ urlpatterns = [
     path("voice_chrome/", views.voice_chrome, name="voice_chrome"),
     path("voice/chat", views.voice_chat, name="voice_chat"),
     path("voice_chrome/chat", views.voice_chat, name="voice_chat"),
+    path("voice/chat/stream", views.voice_chat_stream, name="voice_chat_stream"),
+    path("voice_chrome/chat/stream", views.voice_chat_stream, name="voice_chat_stream"),
     path(
         "api/request_confirmation",
         views.handle_request_confirmation,
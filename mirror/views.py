@@ -14,7 +14,7 @@ from google.oauth2 import service_account
 from notion_client import Client
 
 from django.conf import settings
-from django.http import JsonResponse, HttpRequest
+from django.http import JsonResponse, HttpRequest, StreamingHttpResponse
 from django.shortcuts import render
 from django.utils.dateparse import parse_date
 from django.views.decorators.csrf import csrf_protect, ensure_csrf_cookie, csrf_exempt
@@ -22,14 +22,13 @@ from django.views.decorators.http import require_GET, require_POST, require_http
 from typing import Dict, Any, Literal, List
 
 from . import database_functions
-from .services import get_mcp_service
+from .services import format_agent_response, get_mcp_service
+from .thoughts import DEFAULT_CONVERSATION, thought_bus
 
 logger = logging.getLogger(__name__)
 local_tz = pytz.timezone("America/New_York")
 confirmations_db: Dict[str, Dict[str, Any]] = {}
-thoughts_db: List[str] = []
 db_lock = asyncio.Lock()
-thought_db_lock = asyncio.Lock()
 ConfirmationStatusLiteral = Literal[
     "pending", "confirmed", "denied", "timeout", "error", "not_found"
 ]
@@ -125,6 +124,8 @@ async def voice_chat(request):
     try:
         data = json.loads(request.body)
         msg = data.get("message", "").strip()
+        # Each chat page keeps its own history with the agent.
+        conversation_id = data.get("conversation_id") or DEFAULT_CONVERSATION
         confirmed_action_details = data.get(
             "confirmed_action_details"
         )  # Sent by frontend on confirm
@@ -163,7 +164,7 @@ async def voice_chat(request):
                         status=500,
                     )
 
-                tool_result = await mcp_service.client.session.call_tool(
+                tool_result = await mcp_service.client.call_tool(
                     tool_name, parameters
                 )
 
@@ -231,58 +232,13 @@ async def voice_chat(request):
             # This call goes to Gemini, which might then call an MCP tool.
             # The `process_query` in `mcp_client.py` will interact with Gemini and tools.
             # The final response from Gemini (after any tool calls it makes) is returned.
-            response_text_from_gemini_or_tool = await mcp_service.process_query(msg)
-
+            response_text_from_gemini_or_tool = await mcp_service.process_query(
+                msg, conversation_id
+            )
             try:
-                # Attempt to parse the response. If it's a JSON from our MCP tool (e.g., confirmation_required),
-                # it means Gemini decided the tool's direct JSON output was the answer.
-                parsed_tool_response = json.loads(response_text_from_gemini_or_tool)
-
-                if (
-                    isinstance(parsed_tool_response, dict)
-                    and parsed_tool_response.get("status") == "confirmation_required"
-                ):
-                    return JsonResponse(
-                        {
-                            "needs_confirmation": True,
-                            "action_details": parsed_tool_response.get(
-                                "action_details"
-                            ),
-                            "response": [
-                                parsed_tool_response.get("action_details", {}).get(
-                                    "description", "Please confirm this action."
-                                )
-                            ],
-                        }
-                    )
-                # If a tool ran successfully without confirmation (e.g. get_tasks) and Gemini returned its JSON:
-                elif isinstance(parsed_tool_response, dict) and (
-                    parsed_tool_response.get("status") == "success"
-                    or parsed_tool_response.get("status") == "error"
-                ):
-                    return JsonResponse(
-                        {
-                            "response": [
-                                parsed_tool_response.get("message", "Action processed.")
-                            ],
-                            "updated_data": parsed_tool_response.get(
-                                "updated_data"
-                            ),  # For get_tasks, get_habits etc.
-                        }
-                    )
-                else:
-                    # It was valid JSON but not in our expected tool format. Treat as plain text from Gemini.
-                    response_lines = str(response_text_from_gemini_or_tool).split("\n")
-                    return JsonResponse({"response": response_lines})
-
-            except json.JSONDecodeError:
-                # It's a natural language response from Gemini, not a direct JSON from our tools.
-                response_lines = [
-                    r.strip()
-                    for r in response_text_from_gemini_or_tool.strip().split("\n")
-                    if len(r.strip()) > 0
-                ]
-                return JsonResponse({"response": response_lines})
+                return JsonResponse(
+                    format_agent_response(response_text_from_gemini_or_tool)
+                )
             except Exception as e:
                 logger.error(
                     f"Error processing Gemini's response in voice_chat: {type(e).__name__}: {e}",
@@ -305,6 +261,52 @@ async def voice_chat(request):
             {"error": f"An internal error occurred: {str(e)}"}, status=500
         )
 
+@csrf_exempt
+@require_http_methods(["POST"])
+async def voice_chat_stream(request):
+    """voice_chat for a message, streamed as newline-delimited JSON: a
+    {"type": "delta", "text"} line for each piece of text as the agent writes
+    it, then a {"type": "final"} line with what voice_chat would return."""
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        logger.error("Invalid JSON received in voice_chat_stream request.", exc_info=True)
+        return JsonResponse({"error": "Invalid JSON format."}, status=400)
+    msg = data.get("message", "").strip()
+    conversation_id = data.get("conversation_id") or DEFAULT_CONVERSATION
+    if not msg:
+        return JsonResponse({"error": "Message cannot be empty."}, status=400)
+    try:
+        mcp_service = await get_mcp_service()
+    except Exception as e:
+        logger.error(f"MCP Service not available: {e}", exc_info=True)
+        return JsonResponse(
+            {"error": "Voice service is currently unavailable."}, status=503
+        )
+
+    async def lines():
+        response_text = ""
+        try:
+            async for text in mcp_service.stream_query(msg, conversation_id):
+                if text is None:  # a new model turn after tool calls
+                    response_text = ""
+                    text = "\n"
+                else:
+                    response_text += text
+                yield json.dumps({"type": "delta", "text": text}) + "\n"
+            final = format_agent_response(response_text)
+        except Exception as e:
+            logger.error(
+                f"Error processing voice_chat_stream request: {type(e).__name__}: {e}",
+                exc_info=True,
+            )
+            final = {"error": f"An internal error occurred: {str(e)}"}
+        yield json.dumps({"type": "final", **final}) + "\n"
+
+    logger.info(f"Streaming voice chat query via Gemini: '{msg}'")
+    return StreamingHttpResponse(lines(), content_type="application/x-ndjson")
+
+
 def vision_board_feed(request):
     global seed_offset_vision_board
     folder = os.path.join(settings.BASE_DIR, "mirror/static/mirror/vision")
@@ -387,9 +389,9 @@ async def handle_thought(request: HttpRequest):
     thought = payload.get("thought")
     if not thought:
         return JsonResponse({"error": "Need thought to add to thoughts."}, status=400)
-    async with thought_db_lock:
-        thoughts_db.append(thought)
-    print(thoughts_db)
+    # Only MCP clients outside this process get here; MCPService publishes
+    # to the bus directly.
+    thought_bus.publish(thought, payload.get("conversation"))
     return JsonResponse(
         {
             "thought": thought,
@@ -491,13 +493,8 @@ async def handle_get_confirmation_status(request: HttpRequest, action_id: str):
 
 @require_http_methods(["GET"])
 async def get_pending_thoughts(request: HttpRequest):
-    thoughts = []
-    async with thought_db_lock:
-        for i in range(len(thoughts_db)):
-            item = thoughts_db.pop(0)
-            thoughts.append(item)
-    print(thoughts)
-    return JsonResponse({"thoughts": thoughts})
+    conversation_id = request.GET.get("conversation") or DEFAULT_CONVERSATION
+    return JsonResponse({"thoughts": thought_bus.drain(conversation_id)})
 
 
 @require_http_methods(["GET"])
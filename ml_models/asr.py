@@ -0,0 +1,83 @@
+# ml_models/asr.py
+"""Audio constants and long-form windowing shared by the ASR engines."""
+import numpy as np
+import torch
+
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+TARGET_SAMPLE_RATE = 16000
+# Long-form audio is cut into 30 s windows that overlap by CHUNK_OVERLAP_SECONDS;
+# each window's transcript picks up where the previous one's last complete
+# segment ended (see stitch).
+CHUNK_SECONDS = 30
+CHUNK_OVERLAP_SECONDS = 5
+# A segment ending this close to the end of its window may have been cut off.
+EDGE_SECONDS = 1.0
+LONG_FORM_BATCH_SIZE = 8
+TIME_PRECISION = 0.02  # seconds per Whisper timestamp token
+
+
+def split_windows(audio: np.ndarray) -> list[tuple[int, np.ndarray]]:
+    """Cut audio into overlapping CHUNK_SECONDS windows as (offset, samples).
+
+    Engines decode the windows with timestamps and join their segments with
+    stitch().
+    """
+    window = CHUNK_SECONDS * TARGET_SAMPLE_RATE
+    stride = (CHUNK_SECONDS - CHUNK_OVERLAP_SECONDS) * TARGET_SAMPLE_RATE
+    windows = []
+    offset = 0
+    while True:
+        windows.append((offset, audio[offset : offset + window]))
+        if offset + window >= len(audio):
+            return windows
+        offset += stride
+
+
+def segments(tokens, tokenizer):
+    """Yield (start, end, text) for each timestamped segment in a decoded
+    window; end is None for trailing text without a closing timestamp."""
+    start = 0.0
+    text_tokens = []
+    for token in tokens:
+        if token >= tokenizer.timestamp_begin:
+            time = (token - tokenizer.timestamp_begin) * TIME_PRECISION
+            if text_tokens:
+                yield start, time, tokenizer.decode(text_tokens)
+                text_tokens = []
+            start = time
+        elif token < tokenizer.eot:
+            text_tokens.append(token)
+    if text_tokens:
+        yield start, None, tokenizer.decode(text_tokens)
+
+
+def stitch(windows, window_segments) -> list[str]:
+    """Join the segments of overlapping windows, given in seconds from the
+    start of their window, into one list of texts.
+
+    As in whisper.transcribe, a window hands over at its last complete
+    segment: a segment cut off by the window's end is left to the next window,
+    which has all of it, and the next window skips what was already kept.
+    """
+    texts = []
+    kept_until = 0.0  # seconds of audio already covered by kept segments
+    for i, ((offset, samples), window) in enumerate(zip(windows, window_segments)):
+        window_start = offset / TARGET_SAMPLE_RATE
+        window_end = window_start + len(samples) / TARGET_SAMPLE_RATE
+        last = i == len(windows) - 1
+        for start, end, text in window:
+            start += window_start
+            end = None if end is None else end + window_start
+            # Timestamps of the same speech differ a little between windows, so
+            # compare midpoints.
+            if (start + (start if end is None else end)) / 2 < kept_until:
+                continue
+            cut = end is None or end > window_end - EDGE_SECONDS
+            if cut and not last and start >= windows[i + 1][0] / TARGET_SAMPLE_RATE:
+                break
+            texts.append(text)
+            kept_until = start if end is None else end
+            if cut and not last:
+                # Starts before the next window does: keep what this one heard.
+                break
+    return texts
@@ -0,0 +1,64 @@
+# ml_models/benchmarks/batching.py
+"""Throughput and p95 latency of the ASR worker pool for 1-8 concurrent streams.
+
+Every round, N streams submit the same utterance at the same moment, the way
+several mirrors do when their users stop talking together. Runs once with
+batching disabled and once with the configured batch size and wait.
+
+    python -m ml_models.benchmarks.batching path/to/speech.wav [batch_size] [wait_ms]
+"""
+import asyncio
+import sys
+import time
+
+import numpy as np
+
+from ml_models import asr
+from ml_models.benchmarks.long_form import DEFAULT_ENGINE, DEFAULT_MODEL, load_wav
+from ml_models.workers import ASRWorkerPool
+
+CONCURRENCY = [1, 2, 4, 8]
+ROUNDS = 5
+
+
+async def run(pool: ASRWorkerPool, audio: np.ndarray, streams: int):
+    latencies = []
+
+    async def one():
+        start = time.perf_counter()
+        await pool.transcribe(audio)
+        latencies.append(time.perf_counter() - start)
+
+    await pool.transcribe(audio)  # warm up the worker
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        await asyncio.gather(*[one() for _ in range(streams)])
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, float(np.percentile(latencies, 95))
+
+
+async def main():
+    if len(sys.argv) < 2:
+        print(
+            "Usage: python -m ml_models.benchmarks.batching <speech.wav> [batch_size] [wait_ms]"
+        )
+        sys.exit(1)
+    audio = load_wav(sys.argv[1])[: 30 * asr.TARGET_SAMPLE_RATE]
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    wait_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    print(f"{'mode':>10} {'streams':>8} {'utt/s':>8} {'p95 (s)':>8}")
+    for mode, size, wait in [("unbatched", 1, 0), ("batched", batch_size, wait_ms)]:
+        pool = ASRWorkerPool(
+            1, DEFAULT_ENGINE, DEFAULT_MODEL, asr.DEVICE, size, wait
+        )
+        try:
+            for streams in CONCURRENCY:
+                throughput, p95 = await run(pool, audio, streams)
+                print(f"{mode:>10} {streams:>8} {throughput:>8.2f} {p95:>8.2f}")
+        finally:
+            pool.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
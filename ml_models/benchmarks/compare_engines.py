@@ -0,0 +1,93 @@
+# ml_models/benchmarks/compare_engines.py
+"""Compare ASR engines on accuracy (word error rate) and latency.
+
+Runs every engine in ENGINES over the fixture set (see fixtures/README.md)
+and prints WER and mean/p95 decode time. Pick the fastest engine whose WER
+is still acceptable for mirrors without a GPU.
+
+    python -m ml_models.benchmarks.compare_engines [model] [fixtures_dir]
+"""
+import re
+import sys
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+
+from ml_models import asr
+from ml_models.engines import ENGINES, load_engine
+from ml_models.resample import PolyphaseResampler
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+DEFAULT_MODEL = "small.en"
+REPEATS = 3
+
+
+def load_fixture(wav_path: Path) -> np.ndarray:
+    """Read a mono int16 WAV at any rate as 16 kHz float32."""
+    with wave.open(str(wav_path), "rb") as f:
+        assert f.getnchannels() == 1 and f.getsampwidth() == 2, "expected mono int16"
+        rate = f.getframerate()
+        pcm = f.readframes(f.getnframes())
+    audio = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+    resampler = PolyphaseResampler(rate, asr.TARGET_SAMPLE_RATE)
+    return np.concatenate([resampler.process(audio), resampler.flush()])
+
+
+def words(text: str) -> list[str]:
+    return re.sub(r"[^a-z0-9' ]", " ", text.lower()).split()
+
+
+def word_errors(reference: list[str], hypothesis: list[str]) -> int:
+    """Levenshtein distance between two word lists."""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, start=1):
+        current = [i]
+        for j, hyp_word in enumerate(hypothesis, start=1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (ref_word != hyp_word),
+                )
+            )
+        previous = current
+    return previous[-1]
+
+
+def main():
+    model_name = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_MODEL
+    fixtures_dir = Path(sys.argv[2]) if len(sys.argv) > 2 else FIXTURES_DIR
+    fixtures = [
+        (load_fixture(wav), words(wav.with_suffix(".txt").read_text()))
+        for wav in sorted(fixtures_dir.glob("*.wav"))
+    ]
+    if not fixtures:
+        print(f"No fixtures found in {fixtures_dir}; see fixtures/README.md.")
+        sys.exit(1)
+    audio_seconds = sum(len(a) for a, _ in fixtures) / asr.TARGET_SAMPLE_RATE
+
+    print(f"{len(fixtures)} fixtures, {audio_seconds:.1f} s of audio, model {model_name}")
+    print(f"{'engine':>14} {'WER':>7} {'mean (s)':>9} {'p95 (s)':>8} {'RTF':>6}")
+    for name in ENGINES:
+        engine = load_engine(name, model_name, asr.DEVICE)
+        engine.transcribe(fixtures[0][0])  # warm up
+        errors = reference_words = 0
+        latencies = []
+        for audio, reference in fixtures:
+            for _ in range(REPEATS):
+                start = time.perf_counter()
+                text = engine.transcribe(audio)
+                latencies.append(time.perf_counter() - start)
+            errors += word_errors(reference, words(text))
+            reference_words += len(reference)
+        rtf = sum(latencies) / REPEATS / audio_seconds
+        print(
+            f"{name:>14} {errors / max(reference_words, 1):>7.3f} "
+            f"{np.mean(latencies):>9.2f} {np.percentile(latencies, 95):>8.2f} {rtf:>6.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# ml_models/benchmarks/long_form.py
+"""Check that long-form transcription cost grows linearly with audio length.
+
+Tiles a 16 kHz mono WAV recording to increasing lengths and times an
+engine's transcribe on each. Seconds of compute per second of audio should stay
+roughly flat as the utterance grows.
+
+    python -m ml_models.benchmarks.long_form path/to/speech.wav [engine] [model]
+"""
+import sys
+import time
+import wave
+
+import numpy as np
+
+from ml_models import asr
+from ml_models.engines import load_engine
+
+LENGTHS_SECONDS = [15, 30, 60, 120, 240]
+DEFAULT_ENGINE = "whisper"
+DEFAULT_MODEL = "small.en"
+
+
+def load_wav(path: str) -> np.ndarray:
+    with wave.open(path, "rb") as f:
+        assert f.getframerate() == asr.TARGET_SAMPLE_RATE, "expected 16 kHz audio"
+        assert f.getnchannels() == 1 and f.getsampwidth() == 2, "expected mono int16"
+        pcm = f.readframes(f.getnframes())
+    return np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(
+            "Usage: python -m ml_models.benchmarks.long_form <speech.wav> [engine] [model]"
+        )
+        sys.exit(1)
+    speech = load_wav(sys.argv[1])
+    engine_name = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_ENGINE
+    model_name = sys.argv[3] if len(sys.argv) > 3 else DEFAULT_MODEL
+    engine = load_engine(engine_name, model_name, asr.DEVICE)
+    engine.transcribe(speech[: asr.TARGET_SAMPLE_RATE])  # warm up
+
+    print(f"{'audio (s)':>10} {'decode (s)':>11} {'s per audio s':>14} {'windows':>8}")
+    for seconds in LENGTHS_SECONDS:
+        n = seconds * asr.TARGET_SAMPLE_RATE
+        audio = np.resize(speech, n)
+        start = time.perf_counter()
+        engine.transcribe(audio)
+        elapsed = time.perf_counter() - start
+        windows = len(asr.split_windows(audio)) if n > asr.CHUNK_SECONDS * asr.TARGET_SAMPLE_RATE else 1
+        print(f"{seconds:>10} {elapsed:>11.2f} {elapsed / seconds:>14.3f} {windows:>8}")
+
+
+if __name__ == "__main__":
+    main()
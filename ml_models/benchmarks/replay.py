@@ -0,0 +1,199 @@
+# ml_models/benchmarks/replay.py
+"""Replay recorded speech through ASRConsumer and record ASR performance.
+
+Each fixture (see fixtures/README.md) is resampled to every rate in
+CLIENT_SAMPLE_RATES, the way browsers send it, and streamed over a Channels
+WebsocketCommunicator in 4096-sample frames, either at real-time pacing or as
+fast as possible. For every run it records:
+
+- rtf: decode-bound real-time factor, (wall time - pacing time) / audio length
+- time_to_draft_s: time from sending end_stream to the first transcript (the
+  draft model's, with ASR_DRAFT_MODEL_NAME set)
+- time_to_final_s: time from sending end_stream to the final text, i.e. the
+  socket closing after any transcript_correction
+- peak_rss_mb: peak resident memory of this process plus the ASR workers
+- loop_blocked_ms: longest event-loop stall seen by a 10 ms ticker
+
+Results go to a JSON file. If a baseline already exists at that path, each
+run is compared against it and regressions beyond TOLERANCE are reported.
+Pass --update-baseline to overwrite it. The timings depend on the machine,
+so no baseline is committed: record one on the mirror being tuned, with the
+fixtures it was recorded against, before changing anything.
+
+    python -m ml_models.benchmarks.replay [--fixtures DIR] [--baseline FILE]
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+import wave
+from pathlib import Path
+
+import django
+import numpy as np
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "smartmirror.settings")
+django.setup()
+
+from channels.testing import WebsocketCommunicator  # noqa: E402
+
+from ml_models.benchmarks.compare_engines import FIXTURES_DIR  # noqa: E402
+from ml_models.consumers import ASRConsumer  # noqa: E402
+from ml_models.resample import PolyphaseResampler  # noqa: E402
+from ml_models import workers  # noqa: E402
+from ml_models.workers import start_asr_pool, shutdown_asr_pool  # noqa: E402
+
+CLIENT_SAMPLE_RATES = [16000, 44100, 48000]
+FRAME_SAMPLES = 4096  # ScriptProcessor block size used by the voice page
+TICK_SECONDS = 0.01
+TOLERANCE = 0.2  # fraction a metric may grow before it counts as a regression
+BASELINE_PATH = Path(__file__).resolve().parent / "replay_baseline.json"
+
+
+def load_fixture(wav_path: Path) -> tuple[np.ndarray, int]:
+    with wave.open(str(wav_path), "rb") as f:
+        assert f.getnchannels() == 1 and f.getsampwidth() == 2, "expected mono int16"
+        rate = f.getframerate()
+        pcm = f.readframes(f.getnframes())
+    return np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0, rate
+
+
+def as_client_pcm(audio: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    resampler = PolyphaseResampler(src_rate, dst_rate)
+    out = np.concatenate([resampler.process(audio), resampler.flush()])
+    return (np.clip(out, -1, 1) * 32767).astype("<i2")
+
+
+def peak_rss_mb() -> float:
+    """Peak RSS (VmHWM) of this process and the live ASR workers, in MB."""
+    pids = [os.getpid()]
+    for pool in workers._pools.values():
+        pids += list(getattr(pool.executor, "_processes", {}))
+    total_kb = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                total_kb += next(
+                    int(line.split()[1]) for line in f if line.startswith("VmHWM:")
+                )
+        except (OSError, StopIteration):
+            if pid == os.getpid():
+                total_kb += resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return total_kb / 1024
+
+
+class LoopMonitor:
+    """Measures how late a TICK_SECONDS sleep wakes up, i.e. loop stalls."""
+
+    def __init__(self):
+        self.max_lag = 0.0
+        self.task = None
+
+    async def _tick(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(TICK_SECONDS)
+            self.max_lag = max(self.max_lag, time.perf_counter() - start - TICK_SECONDS)
+
+    def __enter__(self):
+        self.task = asyncio.create_task(self._tick())
+        return self
+
+    def __exit__(self, *exc):
+        self.task.cancel()
+
+
+async def replay(pcm: np.ndarray, rate: int, realtime: bool) -> dict:
+    communicator = WebsocketCommunicator(ASRConsumer.as_asgi(), "/ws/asr/")
+    connected, _ = await communicator.connect()
+    assert connected, "ASRConsumer refused the connection"
+    await communicator.send_json_to({"type": "audio_config", "sampleRate": rate})
+    while (await communicator.receive_json_from()).get("status") != "config_received":
+        pass
+
+    frame_seconds = FRAME_SAMPLES / rate
+    with LoopMonitor() as monitor:
+        start = time.perf_counter()
+        for i in range(0, len(pcm), FRAME_SAMPLES):
+            await communicator.send_to(bytes_data=pcm[i : i + FRAME_SAMPLES].tobytes())
+            if realtime:
+                await asyncio.sleep(frame_seconds)
+        end_sent = time.perf_counter()
+        await communicator.send_json_to({"type": "end_stream"})
+        draft_done = None
+        while True:
+            output = await communicator.receive_output(timeout=300)
+            if output["type"] == "websocket.close":
+                break
+            msg = json.loads(output["text"])
+            if msg.get("type") == "transcript":
+                draft_done = time.perf_counter()
+                transcript = msg["transcript"]
+            elif msg.get("type") == "transcript_correction":
+                transcript = msg["transcript"]
+        done = time.perf_counter()
+    await communicator.disconnect()
+
+    audio_seconds = len(pcm) / rate
+    paced = (end_sent - start) if realtime else 0.0
+    return {
+        "audio_s": round(audio_seconds, 2),
+        "rtf": round((done - start - paced) / audio_seconds, 3),
+        "time_to_draft_s": round(draft_done - end_sent, 3),
+        "time_to_final_s": round(done - end_sent, 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "loop_blocked_ms": round(monitor.max_lag * 1000, 1),
+        "transcript": transcript,
+    }
+
+
+def compare(results: dict, baseline: dict) -> list[str]:
+    regressions = []
+    for run, metrics in results.items():
+        old = baseline.get(run)
+        if not old:
+            continue
+        for key in ("rtf", "time_to_draft_s", "time_to_final_s", "peak_rss_mb", "loop_blocked_ms"):
+            if key in old and old[key] > 0 and metrics[key] > old[key] * (1 + TOLERANCE):
+                regressions.append(f"{run} {key}: {old[key]} -> {metrics[key]}")
+    return regressions
+
+
+async def main(args):
+    fixtures = sorted(Path(args.fixtures).glob("*.wav"))
+    if not fixtures:
+        print(f"No fixtures found in {args.fixtures}; see fixtures/README.md.")
+        sys.exit(1)
+    start_asr_pool()
+    await asyncio.gather(*(pool.ready.wait() for pool in workers._pools.values()))
+
+    results = {}
+    for wav_path in fixtures:
+        audio, src_rate = load_fixture(wav_path)
+        for rate in CLIENT_SAMPLE_RATES:
+            pcm = as_client_pcm(audio, src_rate, rate)
+            for realtime in (True, False):
+                run = f"{wav_path.stem}@{rate}/{'realtime' if realtime else 'fast'}"
+                results[run] = await replay(pcm, rate, realtime)
+                print(run, json.dumps(results[run]))
+
+    baseline_path = Path(args.baseline)
+    if baseline_path.exists() and not args.update_baseline:
+        regressions = compare(results, json.loads(baseline_path.read_text()))
+        print("\n".join(["Regressions:"] + regressions) if regressions else "No regressions.")
+        shutdown_asr_pool()
+        sys.exit(1 if regressions else 0)
+    baseline_path.write_text(json.dumps(results, indent=2) + "\n")
+    print(f"Wrote baseline to {baseline_path}")
+    shutdown_asr_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    asyncio.run(main(parser.parse_args()))
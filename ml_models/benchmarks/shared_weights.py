@@ -0,0 +1,96 @@
+# ml_models/benchmarks/shared_weights.py
+"""Measure per-process memory of N Whisper workers, with and without the
+memory-mapped weights cache (ml_models.weights).
+
+Each worker is spawned like an ASR worker, loads the model, runs one encoder
+and decoder pass so every weight is touched, and reports its PSS (proportional
+set size: shared pages are split between the processes mapping them), RSS and
+private memory from /proc/<pid>/smaps_rollup while all workers are alive.
+
+    python -m ml_models.benchmarks.shared_weights [--model small.en] [--workers 4]
+"""
+import argparse
+import multiprocessing
+import tempfile
+
+import numpy as np
+
+from ml_models.benchmarks.long_form import DEFAULT_MODEL
+
+LOAD_TIMEOUT_SECONDS = 600
+
+
+def smaps_mb(pid: int) -> dict:
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                fields[key] = int(value.split()[0]) / 1024
+    return {
+        "rss_mb": round(fields["Rss"]),
+        "pss_mb": round(fields["Pss"]),
+        "private_mb": round(fields["Private_Clean"] + fields["Private_Dirty"]),
+    }
+
+
+def _worker(model_name, cache_dir, loaded, done):
+    import torch
+
+    from ml_models.weights import load_whisper
+
+    torch.set_num_threads(1)
+    model = load_whisper(model_name, "cpu", cache_dir)
+    with torch.no_grad():
+        features = model.embed_audio(torch.zeros(1, model.dims.n_mels, 3000))
+        model.logits(torch.tensor([[50257]]), features)
+    loaded.release()
+    done.wait()
+
+
+def measure(model_name: str, workers: int, cache_dir: str | None) -> list[dict]:
+    ctx = multiprocessing.get_context("spawn")
+    loaded, done = ctx.Semaphore(0), ctx.Event()
+    procs = [
+        ctx.Process(target=_worker, args=(model_name, cache_dir, loaded, done))
+        for _ in range(workers)
+    ]
+    for p in procs:
+        p.start()
+    for _ in procs:
+        if not loaded.acquire(timeout=LOAD_TIMEOUT_SECONDS):
+            for p in procs:
+                p.kill()
+            raise RuntimeError("A worker did not load the model (out of memory?)")
+    stats = [smaps_mb(p.pid) for p in procs]
+    done.set()
+    for p in procs:
+        p.join()
+    return stats
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_dir = args.cache_dir or tmp
+        # Build the cache up front so the timing of the first worker doesn't matter.
+        from ml_models.weights import build_cache, cache_path
+
+        if not cache_path(cache_dir, args.model).exists():
+            build_cache(args.model, cache_path(cache_dir, args.model))
+        for label, cache in (("whisper.load_model", None), ("mmap cache", cache_dir)):
+            stats = measure(args.model, args.workers, cache)
+            pss = np.mean([s["pss_mb"] for s in stats])
+            print(
+                f"{label:>18}: {args.workers} workers, per worker "
+                f"PSS {pss:.0f} MB, RSS {np.mean([s['rss_mb'] for s in stats]):.0f} MB, "
+                f"private {np.mean([s['private_mb'] for s in stats]):.0f} MB; "
+                f"total PSS {sum(s['pss_mb'] for s in stats)} MB"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--cache-dir", default=None)
+    main(parser.parse_args())
@@ -0,0 +1,35 @@
+# ml_models/codecs.py
+"""Decoders for the audio encodings a client can pick in `audio_config`.
+
+pcm16   little-endian int16 (the default; at 16 kHz the server skips resampling)
+mulaw   G.711 mu-law, one byte per sample
+float16 little-endian IEEE half floats in [-1, 1]
+"""
+import numpy as np
+
+ENCODINGS = ("pcm16", "mulaw", "float16")
+
+
+def _mulaw_table() -> np.ndarray:
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    sign = codes & 0x80
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = (((mantissa << 3) + 0x84) << exponent) - 0x84
+    table = np.where(sign, -magnitude, magnitude).astype(np.float32) / 32768.0
+    table.setflags(write=False)
+    return table
+
+
+MULAW_TABLE = _mulaw_table()
+
+
+def decode_chunk(data: bytes, encoding: str) -> np.ndarray:
+    """Decode one binary WebSocket frame to float32 samples in [-1, 1]."""
+    if encoding == "pcm16":
+        return np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+    if encoding == "mulaw":
+        return MULAW_TABLE[np.frombuffer(data, dtype=np.uint8)]
+    if encoding == "float16":
+        return np.frombuffer(data, dtype="<f2").astype(np.float32)
+    raise ValueError(f"Unsupported audio encoding '{encoding}'")
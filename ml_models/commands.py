@@ -0,0 +1,30 @@
+# ml_models/commands.py
+"""Keyword spotting for short voice commands such as confirm / deny.
+
+Instead of decoding, the recognizer asks the ASR engine how likely each phrase
+in the grammar is (one teacher-forced pass) and accepts the best one if it is
+confident enough. The grammar maps a command name to the phrases that trigger
+it, e.g. {"confirm": ["yes", "confirm"], "deny": ["no", "cancel"]}.
+"""
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+async def spot_command(
+    pool, audio: np.ndarray, grammar: dict[str, list[str]], min_logprob: float
+) -> dict | None:
+    """Return {"command", "phrase", "score"} for the best-matching phrase, or
+    None if no phrase scores at least `min_logprob`."""
+    labelled = [(command, phrase) for command, phrases in grammar.items() for phrase in phrases]
+    if not labelled:
+        return None
+    scores = await pool.score_phrases(audio, [phrase for _, phrase in labelled])
+    best = int(np.argmax(scores))
+    command, phrase = labelled[best]
+    logger.debug(f"Best command match '{phrase}' ({command}) scored {scores[best]:.2f}")
+    if scores[best] < min_logprob:
+        return None
+    return {"command": command, "phrase": phrase, "score": round(scores[best], 3)}
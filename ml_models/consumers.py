@@ -1,34 +1,86 @@
-# ml_models/consumers.py
-import io
 import json
 import logging
-import wave
 import datetime
 import asyncio
+import time
 
 import numpy as np
-import torch
-import whisper
 from channels.generic.websocket import AsyncWebsocketConsumer
-from whisper import DecodingOptions, log_mel_spectrogram
+from django.conf import settings
+
+from mirror.services import format_agent_response, get_mcp_service
+from mirror.thoughts import DEFAULT_CONVERSATION
+
+from .asr import TARGET_SAMPLE_RATE
+from .codecs import ENCODINGS, decode_chunk
+from .commands import spot_command
+from .features import N_MELS, IncrementalLogMel
+from .resample import SUPPORTED_RATES, PolyphaseResampler
+from .ring_buffer import AudioRingBuffer, BufferOverflow
+from .vad import Endpointer, speech_bounds
+from .workers import get_asr_pool, start_asr_pool
 
 logger = logging.getLogger(__name__)
 
-WHISPER_MODEL_NAME = "small.en"
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-WHISPER_MODEL = whisper.load_model(WHISPER_MODEL_NAME, device=DEVICE)
+# Partial transcripts: decode the growing window every PARTIAL_INTERVAL_SECONDS
+# of new audio, once at least MIN_PARTIAL_AUDIO_SECONDS have been buffered.
+PARTIAL_INTERVAL_SECONDS = 1.0
+MIN_PARTIAL_AUDIO_SECONDS = 0.5
 
 
 class ASRConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         await self.accept()
-        self.audio_buffer = bytearray()
+        # Audio is resampled to 16 kHz float32 as it arrives and written into a
+        # preallocated buffer that holds at most ASR_MAX_UTTERANCE_SECONDS.
+        # "finish" ends the utterance when it fills; "drop_oldest" keeps the tail.
+        finish_on_overflow = settings.ASR_OVERFLOW_POLICY == "finish"
+        max_samples = int(settings.ASR_MAX_UTTERANCE_SECONDS * TARGET_SAMPLE_RATE)
+        self.audio = AudioRingBuffer(
+            max_samples,
+            overflow="raise" if finish_on_overflow else settings.ASR_OVERFLOW_POLICY,
+        )
+        # Log-mel frames are computed alongside, so decoding at end of speech
+        # only has to run the model. Sized for the main model once its pool
+        # has reported its mel bins (see _reset_utterance).
+        self.features = IncrementalLogMel(max_samples, get_asr_pool().n_mels or N_MELS)
         self.client_sample_rate = None
+        self.encoding = "pcm16"
+        self.resampler = None
+        self.partials = False
+        # When set, the final transcript goes straight to the MCP agent and
+        # its reply comes back on this socket (the chat's auto-send), in the
+        # client's conversation.
+        self.agent = False
+        self.conversation_id = DEFAULT_CONVERSATION
+        # Agent turns of a persistent session run in the background, so the
+        # next utterance (say, a spoken "yes" to a confirmation the agent is
+        # waiting for) isn't queued behind them.
+        self.agent_tasks: set[asyncio.Task] = set()
+        # Persistent sessions: the client sends end_utterance after each
+        # utterance and the socket stays open for the next one.
+        self.persistent = False
+        # Server-side endpointing: the utterance ends on trailing silence
+        # instead of waiting for the client's end_stream / end_utterance.
+        self.endpointer = None
+        self.partial_task = None
+        self.samples_at_last_partial = 0
+        self.finished = False
+        self.ready_task = None
         logger.info("ASRConsumer connected.")
+        pool = start_asr_pool()
+        if not pool.ready.is_set():
+            # Audio is still accepted and buffered; decoding waits for the workers.
+            await self.send(text_data=json.dumps({"status": pool.status}))
+            self.ready_task = asyncio.create_task(self._announce_ready(pool))
 
     async def disconnect(self, close_code):
         logger.info(f"ASRConsumer disconnected ({close_code}); flushing.")
-        if self.audio_buffer:
+        if self.ready_task is not None:
+            self.ready_task.cancel()
+        for task in self.agent_tasks:
+            task.cancel()
+        if len(self.audio) and not self.finished:
             await self._finish_stream("disconnect_flush")
 
     async def receive(self, text_data=None, bytes_data=None):
@@ -36,67 +88,321 @@ class ASRConsumer(AsyncWebsocketConsumer):
             msg = json.loads(text_data)
             t = msg.get("type")
             if t == "audio_config":
-                self.client_sample_rate = int(msg.get("sampleRate", 0))
-                if not self.client_sample_rate:
-                    return await self._send_error("Invalid sampleRate")
+                sample_rate = int(msg.get("sampleRate", 0))
+                if sample_rate not in SUPPORTED_RATES:
+                    return await self._send_error(
+                        f"Unsupported sampleRate {sample_rate}, expected one of {SUPPORTED_RATES}"
+                    )
+                encoding = msg.get("encoding", "pcm16")
+                if encoding not in ENCODINGS:
+                    return await self._send_error(
+                        f"Unsupported encoding '{encoding}', expected one of {ENCODINGS}"
+                    )
+                self.encoding = encoding
+                # Sent again before each utterance of a persistent session;
+                # keep the resampler unless the rate changed.
+                if sample_rate != self.client_sample_rate:
+                    self.client_sample_rate = sample_rate
+                    self.resampler = PolyphaseResampler(sample_rate, TARGET_SAMPLE_RATE)
+                self.partials = bool(msg.get("partials", False))
+                self.agent = bool(msg.get("agent", False))
+                self.conversation_id = msg.get("conversation") or DEFAULT_CONVERSATION
+                self.persistent = bool(msg.get("persistent", False))
+                if not msg.get("endpointing", False):
+                    self.endpointer = None
+                elif self.endpointer is None:
+                    self.endpointer = Endpointer(
+                        TARGET_SAMPLE_RATE,
+                        settings.ASR_ENDPOINT_SILENCE_MS,
+                        settings.ASR_ENDPOINT_MIN_SPEECH_MS,
+                        settings.ASR_ENDPOINT_HANGOVER_MS,
+                        settings.ASR_VAD_THRESHOLD_DB,
+                    )
+                # A new config starts a new utterance: drop whatever trailed
+                # in after an endpoint.
+                self._reset_utterance()
                 return await self.send(
-                    text_data=json.dumps({"status": "config_received"})
+                    text_data=json.dumps(
+                        {"status": "config_received", "encoding": self.encoding}
+                    )
                 )
             if t == "end_stream":
                 return await self._finish_stream("end_of_stream")
+            if t == "end_utterance":
+                return await self._end_utterance("end_of_utterance")
 
         if bytes_data:
             if not self.client_sample_rate:
                 return await self._send_error("Audio config not received.")
-            self.audio_buffer.extend(bytes_data)
+            if self.finished:
+                return
+            samples = self.resampler.process(decode_chunk(bytes_data, self.encoding))
+            self.features.process(samples)
+            try:
+                self.audio.write(samples)
+            except BufferOverflow as e:
+                logger.warning(f"{e} Finishing the utterance early.")
+                if self.persistent:
+                    return await self._end_utterance("max_duration")
+                return await self._finish_stream("max_duration")
             logger.debug(
-                f"Buffered {len(bytes_data)} bytes (total {len(self.audio_buffer)})"
+                f"Buffered {len(bytes_data)} bytes (total {len(self.audio)} samples)"
+            )
+            if self.endpointer is not None and self.endpointer.process(samples):
+                # Tell the client first so it can stop sending, then decode.
+                await self.send(text_data=json.dumps({"type": "endpoint"}))
+                if self.persistent:
+                    return await self._end_utterance("endpoint")
+                return await self._finish_stream("endpoint")
+            if self._partial_due():
+                self.samples_at_last_partial = len(self.audio)
+                self.partial_task = asyncio.create_task(self._send_partial())
+
+    async def _announce_ready(self, pool):
+        await pool.ready.wait()
+        if not self.finished:
+            await self.send(text_data=json.dumps({"status": "ready"}))
+
+    def _partial_due(self) -> bool:
+        if not self.partials or self.finished:
+            return False
+        # Never queue decodes: skip this tick if the previous one is still running.
+        if self.partial_task is not None and not self.partial_task.done():
+            return False
+        return (
+            len(self.audio) >= MIN_PARTIAL_AUDIO_SECONDS * TARGET_SAMPLE_RATE
+            and len(self.audio) - self.samples_at_last_partial
+            >= PARTIAL_INTERVAL_SECONDS * TARGET_SAMPLE_RATE
+        )
+
+    async def _send_partial(self):
+        # Partials come from the draft model when two-pass is on.
+        pool = get_asr_pool(draft=bool(settings.ASR_DRAFT_MODEL_NAME))
+        model_input, _ = self._model_input(self.audio.view(), [pool])
+        if model_input is None:
+            return
+        if model_input.ndim == 1:
+            # Copy: more audio is written while this decode is pending.
+            model_input = model_input.copy()
+        try:
+            transcript = await pool.transcribe(model_input, partial=True)
+        except Exception as e:
+            logger.warning(f"Partial decode failed: {e}", exc_info=True)
+            return
+        if self.finished or not transcript:
+            return
+        await self.send(
+            text_data=json.dumps(
+                {
+                    "type": "partial_transcript",
+                    "transcript": transcript,
+                    "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+                }
             )
+        )
 
     async def _finish_stream(self, reason: str):
-        # 1) pull out the raw PCM bytes & clear buffer
-        pcm = bytes(self.audio_buffer)
-        self.audio_buffer.clear()
-
-        # 2) convert to numpy float32 in [-1,1]
-        audio_int16 = np.frombuffer(pcm, dtype=np.int16)
-        audio = audio_int16.astype(np.float32) / 32768.0
-
-        # 3) if your incoming sample rate != 16000, resample:
-        if self.client_sample_rate != 16000:
-            # this uses torch + torchaudio; if you don't have torchaudio you can swap in librosa.resample
-            audio_t = torch.from_numpy(audio)
-            audio_t = torch.nn.functional.interpolate(
-                audio_t.unsqueeze(0).unsqueeze(0),
-                scale_factor=16000 / self.client_sample_rate,
-                mode="linear",
-                align_corners=False,
-            ).squeeze()
-            audio = audio_t.cpu().numpy()
-
-        # 4) pad/trim & compute log-mel
-        audio = whisper.pad_or_trim(audio)
-        mel = log_mel_spectrogram(audio).to(DEVICE)
-
-        # 5) decode
-        opts = DecodingOptions(fp16=False, language="en")
-        result = whisper.decode(WHISPER_MODEL, mel, opts)
-        transcript = result.text.strip()
-
-        # 6) send it back
+        await self._transcribe_utterance(reason)
+        await self.close(code=1000, reason="transcription_complete")
+
+    async def _end_utterance(self, reason: str):
+        """Transcribe the utterance but keep the socket, config and resampler
+        filter for the next one. Audio sent meanwhile is queued by Channels
+        and starts the next utterance once this returns."""
+        await self._transcribe_utterance(reason)
+        self._reset_utterance()
+        await self.send(
+            text_data=json.dumps({"type": "utterance_complete", "reason": reason})
+        )
+
+    def _reset_utterance(self):
+        self.audio.clear()
+        n_mels = get_asr_pool().n_mels
+        if n_mels is not None and n_mels != self.features.n_mels:
+            max_samples = int(settings.ASR_MAX_UTTERANCE_SECONDS * TARGET_SAMPLE_RATE)
+            self.features = IncrementalLogMel(max_samples, n_mels)
+        else:
+            self.features.reset()
+        if self.resampler is not None:
+            self.resampler.reset()
+        if self.endpointer is not None:
+            self.endpointer.reset()
+        self.samples_at_last_partial = 0
+        self.finished = False
+
+    async def _transcribe_utterance(self, reason: str):
+        # 1) stop partials and let any in-flight decode finish before the final one
+        self.finished = True
+        if self.partial_task is not None:
+            await asyncio.gather(self.partial_task, return_exceptions=True)
+            self.partial_task = None
+
+        # 2) drain the resampler into the buffer
+        if self.resampler is not None:
+            samples = self.resampler.flush()
+            self.features.process(samples)
+            try:
+                self.audio.write(samples)
+            except BufferOverflow:
+                pass
+
+        # 3) trim silence and decode the speech in an ASR worker, as log-mel
+        # frames when they were computed on the fly, else as a zero-copy view
+        # of the buffer (nothing is written to it once the stream is finished).
+        # Short utterances are first matched against the command grammar,
+        # which skips the full decode when one of its phrases was said. With
+        # two-pass the fast draft model scores them, so a short utterance that
+        # isn't a command doesn't wait for the full model before its draft.
+        end_of_speech = time.perf_counter()
+        pools = [get_asr_pool()]
+        if settings.ASR_DRAFT_MODEL_NAME:
+            pools.append(get_asr_pool(draft=True))
+        model_input, n_speech = self._model_input(self.audio.view(), pools)
+        command = await self._spot_command(pools[-1], model_input, n_speech)
+        final_task = None
+        try:
+            if command is not None:
+                await self.send(text_data=json.dumps({"type": "command", **command}))
+                transcript = command["phrase"]
+            elif model_input is None:
+                transcript = ""
+            elif settings.ASR_DRAFT_MODEL_NAME:
+                # Two-pass: both models start now and the draft model's text goes
+                # out as soon as it is ready; the full model's follows below.
+                final_task = asyncio.create_task(get_asr_pool().transcribe(model_input))
+                try:
+                    transcript = await get_asr_pool(draft=True).transcribe(model_input)
+                except Exception as e:
+                    logger.warning(f"Draft decode failed: {e}", exc_info=True)
+                    transcript = await final_task
+                    final_task = None
+            else:
+                transcript = await get_asr_pool().transcribe(model_input)
+        except Exception as e:
+            # E.g. a worker died; the pool restarts itself (see ASRWorkerPool).
+            logger.error(f"Transcription failed: {e}", exc_info=True)
+            self.audio.clear()
+            self.features.reset()
+            return await self._send_error(f"Transcription failed: {e}")
+        elapsed_ms = round((time.perf_counter() - end_of_speech) * 1000)
+
+        # 4) send it back, then hand it to the agent in-process when asked to,
+        # instead of the browser POSTing it back to /voice/chat. A recognized
+        # command is handled by the client and nobody is listening any more
+        # after a disconnect.
+        forward = (
+            self.agent
+            and command is None
+            and bool(transcript.strip())
+            and reason != "disconnect_flush"
+        )
+        timing = "time_to_draft_ms" if final_task is not None else "time_to_final_ms"
         await self.send(
             text_data=json.dumps(
                 {
                     "type": "transcript",
                     "transcript": transcript,
                     "reason": reason,
+                    "agent": forward,
+                    "draft": final_task is not None,
+                    timing: elapsed_ms,
                     "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
                 }
             )
         )
+        if final_task is not None:
+            transcript = await self._send_correction(transcript, final_task, end_of_speech)
+            logger.info(
+                f"Two-pass ASR: draft after {elapsed_ms} ms, final after "
+                f"{round((time.perf_counter() - end_of_speech) * 1000)} ms."
+            )
+        self.audio.clear()
+        self.features.reset()
+        if forward and self.persistent:
+            task = asyncio.create_task(self._send_agent_response(transcript.strip()))
+            self.agent_tasks.add(task)
+            task.add_done_callback(self.agent_tasks.discard)
+        elif forward:
+            # The socket closes after this utterance; reply before it does.
+            await self._send_agent_response(transcript.strip())
 
-        # 7) close the WS
-        await self.close(code=1000, reason="transcription_complete")
+    async def _spot_command(self, pool, model_input, n_speech: int):
+        max_samples = settings.ASR_COMMAND_MAX_SECONDS * TARGET_SAMPLE_RATE
+        if model_input is None or n_speech > max_samples:
+            return None
+        try:
+            return await spot_command(
+                pool,
+                model_input,
+                settings.ASR_COMMANDS,
+                settings.ASR_COMMAND_MIN_LOGPROB,
+            )
+        except Exception as e:
+            logger.warning(f"Command spotting failed: {e}", exc_info=True)
+            return None
+
+    async def _send_correction(self, draft: str, final_task, end_of_speech: float) -> str:
+        """Wait for the full model and send its text if it differs from the draft."""
+        try:
+            final = await final_task
+        except Exception as e:
+            logger.warning(f"Final decode failed, keeping the draft: {e}", exc_info=True)
+            return draft
+        if final.strip() != draft.strip():
+            await self.send(
+                text_data=json.dumps(
+                    {
+                        "type": "transcript_correction",
+                        "transcript": final,
+                        "time_to_final_ms": round(
+                            (time.perf_counter() - end_of_speech) * 1000
+                        ),
+                        "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+                    }
+                )
+            )
+        return final
+
+    async def _send_agent_response(self, query: str):
+        """Stream the agent's reply as "agent_delta" frames, then send the
+        shaped reply as "agent_response"."""
+        try:
+            mcp_service = await get_mcp_service()
+            response_text = ""
+            async for text in mcp_service.stream_query(query, self.conversation_id):
+                if text is None:  # a new model turn after tool calls
+                    response_text = ""
+                    text = "\n"
+                else:
+                    response_text += text
+                await self.send(text_data=json.dumps({"type": "agent_delta", "text": text}))
+            payload = format_agent_response(response_text)
+        except Exception as e:
+            logger.error(f"Agent query from ASR failed: {e}", exc_info=True)
+            payload = {"error": f"An internal error occurred: {str(e)}"}
+        await self.send(text_data=json.dumps({"type": "agent_response", **payload}))
+
+    def _model_input(self, audio: np.ndarray, pools: list):
+        """Return (input, speech samples) for the speech in `audio`, to be
+        decoded by `pools`.
+
+        The input is the precomputed log-mel window when the buffered audio
+        still lines up with the feature frames and every pool's model takes
+        that many mel bins, otherwise the trimmed audio; (None, 0) when there
+        is no speech.
+        """
+        start, end = speech_bounds(
+            audio, TARGET_SAMPLE_RATE, settings.ASR_VAD_THRESHOLD_DB
+        )
+        if start == end:
+            return None, 0
+        if not self.audio.dropped and all(
+            pool.n_mels == self.features.n_mels for pool in pools
+        ):
+            mel = self.features.log_mel(audio, start, end)
+            if mel is not None:
+                return mel, end - start
+        return audio[start:end], end - start
 
     async def _send_error(self, msg: str):
         logger.warning(msg)
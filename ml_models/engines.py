@@ -0,0 +1,163 @@
+# ml_models/engines.py
+"""Pluggable ASR engines. settings.ASR_ENGINE picks one from ENGINES.
+
+An engine turns 16 kHz float32 audio into text. Each input is either 1-D
+audio or an already computed (n_mels, 3000) log-mel window (see
+ml_models.features). The ASR workers load one engine per process and call
+transcribe_batch() on it.
+"""
+import logging
+
+import numpy as np
+import torch
+import whisper
+from whisper import DecodingOptions, log_mel_spectrogram
+
+from . import asr
+from .weights import load_whisper
+
+logger = logging.getLogger(__name__)
+
+
+class ASREngine:
+    name = None
+    # Mel bins of the (n_mels, 3000) windows the engine accepts.
+    n_mels = 80
+
+    def transcribe_batch(self, audios: list[np.ndarray], partial: bool = False) -> list[str]:
+        raise NotImplementedError
+
+    def transcribe(self, audio: np.ndarray, partial: bool = False) -> str:
+        return self.transcribe_batch([audio], partial)[0]
+
+    def score_phrases(self, audio: np.ndarray, phrases: list[str]) -> list[float]:
+        """Mean per-token log-probability of each phrase being what was said."""
+        raise NotImplementedError
+
+
+class WhisperEngine(ASREngine):
+    """openai-whisper on PyTorch, on GPU when there is one."""
+
+    name = "whisper"
+
+    def __init__(self, model_name: str, device: str, weights_dir: str | None = None):
+        self.device = device
+        # With weights_dir, CPU weights are memory-mapped and shared between
+        # processes (see ml_models.weights).
+        self.model = load_whisper(model_name, device, weights_dir)
+        self.n_mels = self.model.dims.n_mels
+        self.tokenizer = whisper.tokenizer.get_tokenizer(
+            self.model.is_multilingual,
+            num_languages=self.model.num_languages,
+            language="en",
+            task="transcribe",
+        )
+
+    def _mel(self, inputs) -> torch.Tensor:
+        return torch.stack(
+            [
+                torch.from_numpy(x)
+                if x.ndim == 2
+                else log_mel_spectrogram(whisper.pad_or_trim(x), self.model.dims.n_mels)
+                for x in inputs
+            ]
+        ).to(self.device)
+
+    def transcribe_batch(self, audios: list[np.ndarray], partial: bool = False) -> list[str]:
+        """Decode several utterances, stacking all the <= 30 s ones into one batch."""
+        texts = [""] * len(audios)
+        short = []
+        for i, audio in enumerate(audios):
+            if audio.ndim == 1 and len(audio) > whisper.audio.N_SAMPLES:
+                texts[i] = self.transcribe_long(audio)
+            else:
+                short.append(i)
+        if short:
+            # Partials only need the text, so skip timestamp tokens to shorten decoding.
+            opts = DecodingOptions(fp16=False, language="en", without_timestamps=partial)
+            results = whisper.decode(self.model, self._mel([audios[i] for i in short]), opts)
+            for i, result in zip(short, results):
+                texts[i] = result.text.strip()
+        return texts
+
+    def transcribe_long(self, audio: np.ndarray) -> str:
+        """Decode audio longer than 30 s as batched, overlapping windows
+        stitched by timestamp (see asr.split_windows)."""
+        windows = asr.split_windows(audio)
+        opts = DecodingOptions(fp16=False, language="en")
+        window_segments = []
+        for b in range(0, len(windows), asr.LONG_FORM_BATCH_SIZE):
+            batch = windows[b : b + asr.LONG_FORM_BATCH_SIZE]
+            results = whisper.decode(self.model, self._mel([w for _, w in batch]), opts)
+            window_segments += [
+                list(asr.segments(result.tokens, self.tokenizer)) for result in results
+            ]
+        pieces = asr.stitch(windows, window_segments)
+        return " ".join(p.strip() for p in pieces if p.strip())
+
+    def score_phrases(self, audio: np.ndarray, phrases: list[str]) -> list[float]:
+        """Score each phrase with one teacher-forced decoder pass.
+
+        The audio is encoded once and every phrase (followed by end-of-text)
+        is fed to the decoder as a batch, so this costs a single decoder step
+        instead of an autoregressive decode.
+        """
+        prefix = list(self.tokenizer.sot_sequence_including_notimestamps)
+        targets = [
+            self.tokenizer.encode(" " + p.strip()) + [self.tokenizer.eot] for p in phrases
+        ]
+        length = len(prefix) + max(len(t) for t in targets) - 1
+        tokens = torch.full((len(phrases), length), self.tokenizer.eot, dtype=torch.long)
+        for i, target in enumerate(targets):
+            sequence = prefix + target[:-1]
+            tokens[i, : len(sequence)] = torch.tensor(sequence)
+        with torch.no_grad():
+            features = self.model.embed_audio(self._mel([audio]))
+            logits = self.model.logits(
+                tokens.to(self.device), features.expand(len(phrases), -1, -1)
+            )
+            logprobs = torch.log_softmax(logits.float(), dim=-1).cpu()
+        scores = []
+        for i, target in enumerate(targets):
+            # Position p predicts token p + 1, so target[k] comes from prefix end + k.
+            positions = torch.arange(len(target)) + len(prefix) - 1
+            scores.append(logprobs[i, positions, torch.tensor(target)].mean().item())
+        return scores
+
+
+class QuantizedWhisperEngine(WhisperEngine):
+    """Whisper with int8 dynamically-quantized Linear layers, for CPU-only mirrors.
+
+    Weights of every Linear layer (attention projections and MLPs, most of the
+    model) are stored as int8 and activations are quantized on the fly, which
+    cuts their memory 4x and speeds up CPU matmuls. The int8 weights are new
+    tensors private to the process, so with weights_dir only the remaining
+    layers stay shared between workers.
+    """
+
+    name = "whisper_int8"
+
+    def __init__(self, model_name: str, device: str = "cpu", weights_dir: str | None = None):
+        if device != "cpu":
+            logger.warning(f"{self.name} only runs on CPU; ignoring device '{device}'.")
+        super().__init__(model_name, "cpu", weights_dir)
+        # whisper.model.Linear only adds fp16 casting on top of nn.Linear, and
+        # quantize_dynamic matches exact module types, so downcast first.
+        for module in self.model.modules():
+            if type(module) is whisper.model.Linear:
+                module.__class__ = torch.nn.Linear
+        # In place: a copy of the model would drop the memory-mapped weights.
+        self.model = torch.ao.quantization.quantize_dynamic(
+            self.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+
+
+ENGINES = {engine.name: engine for engine in (WhisperEngine, QuantizedWhisperEngine)}
+
+
+def load_engine(
+    name: str, model_name: str, device: str, weights_dir: str | None = None
+) -> ASREngine:
+    if name not in ENGINES:
+        raise ValueError(f"Unknown ASR engine '{name}', expected one of {list(ENGINES)}")
+    return ENGINES[name](model_name, device, weights_dir)
@@ -0,0 +1,108 @@
+# ml_models/features.py
+"""Incremental log-mel features, computed as audio arrives.
+
+IncrementalLogMel keeps the un-normalized log10 mel frames of a 16 kHz stream,
+computing each STFT frame as soon as its 400-sample window has been received.
+At end of speech, log_mel() assembles the exact input Whisper expects,
+`log_mel_spectrogram(pad_or_trim(audio[start:end]))`, from those frames: only
+the few frames touching the segment edges (reflect and zero padding) are
+recomputed, and the global max clamp and scaling are applied last.
+"""
+import functools
+
+import numpy as np
+from whisper.audio import HOP_LENGTH, N_FFT, N_FRAMES, N_SAMPLES, mel_filters
+
+N_MELS = 80
+HALF_WINDOW = N_FFT // 2
+# torch.hann_window is periodic.
+WINDOW = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(N_FFT) / N_FFT)
+# log10 of the clamp floor: the value of a frame of pure zero padding.
+SILENT_FRAME = np.log10(1e-10)
+FIRST_CACHED_FRAME = 2  # frames 0 and 1 reach into the left reflect padding
+
+
+@functools.lru_cache(maxsize=None)
+def _filters(n_mels: int) -> np.ndarray:
+    return mel_filters("cpu", n_mels).numpy().astype(np.float64)
+
+
+def log_mel_frames(windows: np.ndarray, n_mels: int = N_MELS) -> np.ndarray:
+    """Raw log10 mel power of (n, N_FFT) sample windows, shape (n_mels, n)."""
+    spectrum = np.fft.rfft(windows * WINDOW, axis=1)
+    power = spectrum.real**2 + spectrum.imag**2
+    return np.log10(np.maximum(_filters(n_mels) @ power.T, 1e-10))
+
+
+def normalize(log_spec: np.ndarray) -> np.ndarray:
+    log_spec = np.maximum(log_spec, log_spec.max() - 8.0)
+    return ((log_spec + 4.0) / 4.0).astype(np.float32)
+
+
+class IncrementalLogMel:
+    def __init__(self, max_samples: int, n_mels: int = N_MELS):
+        self.n_mels = n_mels
+        self.frames = np.zeros((n_mels, max_samples // HOP_LENGTH + 1))
+        self.reset()
+
+    def reset(self):
+        """Start a new stream, reusing the frame buffer (stale frames are
+        overwritten before they are read)."""
+        self.n_frames = FIRST_CACHED_FRAME
+        self.total = 0
+        self.tail = np.zeros(0)  # the samples still needed for future frames
+        self.tail_start = 0  # stream index of tail[0]
+        self.overflowed = False
+
+    def process(self, samples: np.ndarray):
+        """Add the next samples and compute every frame they complete."""
+        self.tail = np.concatenate([self.tail, samples])
+        self.total += len(samples)
+        last = (self.total - HALF_WINDOW) // HOP_LENGTH
+        if last >= self.frames.shape[1]:
+            self.overflowed = True
+            last = self.frames.shape[1] - 1
+        if last >= self.n_frames:
+            centers = np.arange(self.n_frames, last + 1) * HOP_LENGTH
+            idx = (centers - HALF_WINDOW - self.tail_start)[:, None] + np.arange(N_FFT)
+            self.frames[:, self.n_frames : last + 1] = log_mel_frames(
+                self.tail[idx], self.n_mels
+            )
+            self.n_frames = last + 1
+        drop = self.n_frames * HOP_LENGTH - HALF_WINDOW - self.tail_start
+        if drop > 0:
+            self.tail = self.tail[drop:]
+            self.tail_start += drop
+
+    def log_mel(self, audio: np.ndarray, start: int, end: int) -> np.ndarray | None:
+        """Whisper's normalized (n_mels, N_FRAMES) log-mel of audio[start:end].
+
+        `audio` is the whole stream seen by process(). Returns None when the
+        cached frames can't be used: a start that isn't a multiple of the hop
+        length, more than 30 s of audio, or a stream that overflowed.
+        """
+        length = end - start
+        if start % HOP_LENGTH or length > N_SAMPLES or self.overflowed:
+            return None
+        out = np.full((self.n_mels, N_FRAMES), SILENT_FRAME)
+
+        # Frames whose whole window lies inside the segment are already cached.
+        first = start // HOP_LENGTH
+        interior_end = max(FIRST_CACHED_FRAME, (length - HALF_WINDOW) // HOP_LENGTH + 1)
+        out[:, FIRST_CACHED_FRAME:interior_end] = self.frames[
+            :, first + FIRST_CACHED_FRAME : first + interior_end
+        ]
+
+        # Frames entirely in the zero padding keep SILENT_FRAME; recompute the
+        # ones that straddle an edge of the segment or the end of the window.
+        padding_start = -(-(length + HALF_WINDOW) // HOP_LENGTH)
+        edges = sorted(
+            {0, 1, N_FRAMES - 2, N_FRAMES - 1}
+            | set(range(interior_end, min(padding_start, N_FRAMES)))
+        )
+        idx = (np.array(edges) * HOP_LENGTH - HALF_WINDOW)[:, None] + np.arange(N_FFT)
+        idx = np.abs(idx)  # reflect padding at the start
+        idx = np.where(idx >= N_SAMPLES, 2 * (N_SAMPLES - 1) - idx, idx)
+        windows = np.where(idx < length, audio[start + np.minimum(idx, length - 1)], 0.0)
+        out[:, edges] = log_mel_frames(windows, self.n_mels)
+        return normalize(out)
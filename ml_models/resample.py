@@ -0,0 +1,101 @@
+# ml_models/resample.py
+"""Streaming polyphase resampler for client audio, vectorized in NumPy.
+
+The anti-aliasing filter for a (source, target) rate pair is designed once
+and cached, so per-connection setup is free after the first client at a given
+rate. Chunks are resampled as they arrive; only `flush()` is left for the end
+of the utterance, and it just drains the filter delay.
+"""
+import functools
+import math
+
+import numpy as np
+
+# Filter half-length in units of the slower of the up/down rates (as in
+# scipy.signal.resample_poly), and its Kaiser window shape.
+HALF_LENGTH_FACTOR = 10
+KAISER_BETA = 5.0
+# Client rates the consumer accepts. The filter grows with up/down, so an odd
+# rate (e.g. 999983 Hz) would take seconds and gigabytes to design.
+SUPPORTED_RATES = (8000, 11025, 16000, 22050, 24000, 32000, 44100, 48000, 96000)
+
+
+@functools.lru_cache(maxsize=len(SUPPORTED_RATES))
+def polyphase_filter(src_rate: int, dst_rate: int):
+    """Return (phases, up, down, delay) for resampling src_rate -> dst_rate.
+
+    `phases[p, k]` is tap p + k*up of a windowed-sinc low-pass filter, so the
+    output sample at upsampled position n is `phases[n % up] @ x[n//up - k]`.
+    """
+    g = math.gcd(src_rate, dst_rate)
+    up, down = dst_rate // g, src_rate // g
+    max_rate = max(up, down)
+    half_len = HALF_LENGTH_FACTOR * max_rate
+    n = np.arange(2 * half_len + 1) - half_len
+    cutoff = 1.0 / max_rate
+    taps = cutoff * np.sinc(cutoff * n) * np.kaiser(len(n), KAISER_BETA)
+    taps *= up / taps.sum()
+
+    per_phase = -(-len(taps) // up)
+    taps = np.pad(taps, (0, per_phase * up - len(taps)))
+    phases = taps.reshape(per_phase, up).T.astype(np.float32)
+    phases.setflags(write=False)
+    return phases, up, down, half_len
+
+
+class PolyphaseResampler:
+    def __init__(self, src_rate: int, dst_rate: int):
+        self.passthrough = src_rate == dst_rate
+        self.phases, self.up, self.down, self.delay = polyphase_filter(
+            src_rate, dst_rate
+        )
+        self.reset()
+
+    def reset(self):
+        """Start a new stream with the same filter, e.g. for the next utterance."""
+        per_phase = self.phases.shape[1]
+        # Input history, starting with zeros so the first outputs have context.
+        self.buffer = np.zeros(per_phase - 1, dtype=np.float32)
+        self.buffer_start = -(per_phase - 1)  # input index of buffer[0]
+        self.total_in = 0
+        self.total_out = 0
+
+    def process(self, chunk: np.ndarray) -> np.ndarray:
+        """Resample the next chunk, returning every output sample it completes."""
+        if self.passthrough:
+            self.total_in += len(chunk)
+            self.total_out += len(chunk)
+            return chunk.astype(np.float32, copy=False)
+        self.buffer = np.concatenate([self.buffer, chunk.astype(np.float32, copy=False)])
+        self.total_in += len(chunk)
+
+        # Output m needs input up to (m*down + delay) // up.
+        last = ((self.total_in - 1) * self.up - self.delay) // self.down
+        if last < self.total_out:
+            return np.zeros(0, dtype=np.float32)
+        n = np.arange(self.total_out, last + 1) * self.down + self.delay
+        newest = n // self.up - self.buffer_start
+        per_phase = self.phases.shape[1]
+        idx = newest[:, None] - np.arange(per_phase)[None, :]
+        out = np.einsum("mk,mk->m", self.phases[n % self.up], self.buffer[idx])
+        self.total_out = last + 1
+
+        # Drop history the next output no longer needs.
+        keep_from = (self.total_out * self.down + self.delay) // self.up - (
+            per_phase - 1
+        )
+        drop = max(0, keep_from - self.buffer_start)
+        self.buffer = self.buffer[drop:]
+        self.buffer_start += drop
+        return out.astype(np.float32, copy=False)
+
+    def flush(self) -> np.ndarray:
+        """Drain the filter delay; returns the remaining output samples."""
+        expected = -(-self.total_in * self.up // self.down)
+        if self.passthrough or self.total_out >= expected:
+            return np.zeros(0, dtype=np.float32)
+        total_in = self.total_in
+        out = self.process(np.zeros(self.delay // self.up + 1, dtype=np.float32))
+        self.total_in = total_in
+        remaining = expected - (self.total_out - len(out))
+        return out[:remaining]
@@ -0,0 +1,80 @@
+# ml_models/ring_buffer.py
+"""Preallocated, capacity-bounded audio buffer for one ASR connection."""
+import numpy as np
+
+OVERFLOW_RAISE = "raise"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+
+
+class BufferOverflow(Exception):
+    pass
+
+
+class AudioRingBuffer:
+    """Fixed-capacity ring of samples.
+
+    Memory is allocated once up front, so a client that never stops streaming
+    can't grow it. On overflow the buffer either keeps what fits and raises
+    BufferOverflow (OVERFLOW_RAISE), or overwrites the oldest samples so it
+    always holds the most recent `capacity` samples (OVERFLOW_DROP_OLDEST).
+    """
+
+    def __init__(self, capacity: int, dtype=np.float32, overflow: str = OVERFLOW_RAISE):
+        if overflow not in (OVERFLOW_RAISE, OVERFLOW_DROP_OLDEST):
+            raise ValueError(f"Unknown overflow policy '{overflow}'")
+        self.buffer = np.zeros(capacity, dtype=dtype)
+        self.capacity = capacity
+        self.overflow = overflow
+        self.start = 0
+        self.size = 0
+        self.dropped = 0  # samples overwritten by OVERFLOW_DROP_OLDEST
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        self.start = 0
+        self.size = 0
+        self.dropped = 0
+
+    def write(self, samples: np.ndarray):
+        n = len(samples)
+        free = self.capacity - self.size
+        if n > free and self.overflow == OVERFLOW_RAISE:
+            self._append(samples[:free])
+            raise BufferOverflow(
+                f"Audio buffer full ({self.capacity} samples); dropped {n - free}."
+            )
+        if n >= self.capacity:
+            # Only the newest `capacity` samples survive.
+            self.dropped += self.size + n - self.capacity
+            self.buffer[:] = samples[-self.capacity :]
+            self.start = 0
+            self.size = self.capacity
+            return
+        if n > free:
+            dropped = n - free
+            self.start = (self.start + dropped) % self.capacity
+            self.size -= dropped
+            self.dropped += dropped
+        self._append(samples)
+
+    def _append(self, samples: np.ndarray):
+        n = len(samples)
+        end = (self.start + self.size) % self.capacity
+        first = min(n, self.capacity - end)
+        self.buffer[end : end + first] = samples[:first]
+        self.buffer[: n - first] = samples[first:]
+        self.size += n
+
+    def view(self) -> np.ndarray:
+        """Return the buffered samples, oldest first, without copying.
+
+        If the data has wrapped around the end, it is rotated back to the start
+        of the buffer once, so later views are zero-copy again. The view is only
+        valid until the next write().
+        """
+        if self.start + self.size > self.capacity:
+            self.buffer[:] = np.roll(self.buffer, -self.start)
+            self.start = 0
+        return self.buffer[self.start : self.start + self.size]
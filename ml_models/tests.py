@@ -1,3 +1,194 @@
-from django.test import TestCase
+import numpy as np
+import whisper
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from .asr import TARGET_SAMPLE_RATE, split_windows, stitch
+from .codecs import decode_chunk
+from .features import IncrementalLogMel
+from .resample import PolyphaseResampler
+from .ring_buffer import OVERFLOW_DROP_OLDEST, AudioRingBuffer, BufferOverflow
+from .vad import speech_bounds
+
+
+class IncrementalLogMelTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # 35 s of noise with louder bursts, so the normalization clamp matters.
+        self.audio = (0.05 * rng.standard_normal(35 * 16000)).astype(np.float32)
+        self.audio[16000:24000] *= 10
+        self.features = IncrementalLogMel(len(self.audio))
+        # Feed it in uneven chunks, as the websocket delivers it.
+        offset = 0
+        for size in rng.integers(1, 4000, size=len(self.audio)):
+            if offset >= len(self.audio):
+                break
+            self.features.process(self.audio[offset : offset + size])
+            offset += size
+
+    def assert_matches_whisper(self, start, end):
+        expected = whisper.log_mel_spectrogram(
+            whisper.pad_or_trim(self.audio[start:end])
+        ).numpy()
+        actual = self.features.log_mel(self.audio, start, end)
+        self.assertEqual(actual.shape, expected.shape)
+        np.testing.assert_allclose(actual, expected, atol=1e-3)
+
+    def test_matches_log_mel_spectrogram(self):
+        for start, end in [
+            (0, 16000),
+            (0, 30 * 16000),
+            (3200, 3200 + 123457),
+            (160 * 777, 160 * 777 + 400),
+            (5 * 16000, 35 * 16000),
+        ]:
+            with self.subTest(start=start, end=end):
+                self.assert_matches_whisper(start, end)
+
+    def test_falls_back_when_frames_do_not_line_up(self):
+        self.assertIsNone(self.features.log_mel(self.audio, 100, 16000))
+        self.assertIsNone(self.features.log_mel(self.audio, 0, 31 * 16000))
+
+    def test_reset_reuses_the_frame_buffer(self):
+        frames = self.features.frames
+        self.features.reset()
+        self.features.reset()
+        self.assertIs(self.features.frames, frames)
+        self.features.process(self.audio[: 5 * 16000])
+        self.assert_matches_whisper(0, 5 * 16000)
+
+
+class PolyphaseResamplerTests(SimpleTestCase):
+    RATES = [8000, 16000, 22050, 44100, 48000]
+
+    def resample(self, audio, rate, chunk_sizes=None):
+        resampler = PolyphaseResampler(rate, TARGET_SAMPLE_RATE)
+        if chunk_sizes is None:
+            chunks = [audio]
+        else:
+            bounds = np.cumsum([0, *chunk_sizes])
+            chunks = [audio[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+        return np.concatenate([*map(resampler.process, chunks), resampler.flush()])
+
+    def test_sine_matches_the_analytic_signal(self):
+        for rate in self.RATES:
+            with self.subTest(rate=rate):
+                audio = np.sin(2 * np.pi * 440 * np.arange(rate) / rate).astype(np.float32)
+                out = self.resample(audio, rate)
+                self.assertEqual(len(out), TARGET_SAMPLE_RATE)
+                expected = np.sin(2 * np.pi * 440 * np.arange(len(out)) / TARGET_SAMPLE_RATE)
+                # Away from the zero-padded edges; upsampling from 8 kHz has
+                # the most passband ripple.
+                atol = 2e-3 if rate < TARGET_SAMPLE_RATE else 1e-3
+                np.testing.assert_allclose(out[800:-800], expected[800:-800], atol=atol)
+
+    def test_chunked_matches_one_shot(self):
+        rng = np.random.default_rng(0)
+        for rate in self.RATES:
+            with self.subTest(rate=rate):
+                audio = rng.standard_normal(rate).astype(np.float32)
+                sizes = rng.integers(1, 3000, size=rate)
+                sizes = sizes[: np.searchsorted(np.cumsum(sizes), rate) + 1]
+                np.testing.assert_array_equal(
+                    self.resample(audio, rate, sizes), self.resample(audio, rate)
+                )
+
+
+class StitchTests(SimpleTestCase):
+    def setUp(self):
+        # Two windows: 0-30 s and 25-40 s.
+        self.windows = split_windows(np.zeros(40 * TARGET_SAMPLE_RATE, dtype=np.float32))
+        self.assertEqual([offset for offset, _ in self.windows], [0, 25 * TARGET_SAMPLE_RATE])
+
+    def test_cut_segment_is_left_to_the_next_window(self):
+        texts = stitch(
+            self.windows,
+            [
+                [(0.0, 12.0, "a"), (12.0, 26.0, "b"), (26.0, None, "c-cut")],
+                [(0.0, 1.2, "b-tail"), (1.2, 6.0, "c"), (6.0, 15.0, "d")],
+            ],
+        )
+        self.assertEqual(texts, ["a", "b", "c", "d"])
+
+    def test_cut_segment_starting_before_the_next_window_is_kept_once(self):
+        texts = stitch(
+            self.windows,
+            [
+                [(0.0, 20.0, "a"), (20.0, 29.5, "b")],
+                [(0.0, 4.4, "b-again"), (4.4, 9.0, "c")],
+            ],
+        )
+        self.assertEqual(texts, ["a", "b", "c"])
+
+    def test_last_window_keeps_its_trailing_text(self):
+        windows = self.windows[:1]
+        self.assertEqual(stitch(windows, [[(0.0, 5.0, "a"), (5.0, None, "b")]]), ["a", "b"])
+
+
+class AudioRingBufferTests(SimpleTestCase):
+    def test_raise_keeps_what_fits(self):
+        buffer = AudioRingBuffer(5)
+        buffer.write(np.arange(3, dtype=np.float32))
+        with self.assertRaises(BufferOverflow):
+            buffer.write(np.arange(3, 6, dtype=np.float32))
+        np.testing.assert_array_equal(buffer.view(), np.arange(5))
+
+    def test_drop_oldest_keeps_the_newest_samples_in_order(self):
+        buffer = AudioRingBuffer(5, overflow=OVERFLOW_DROP_OLDEST)
+        for start in range(0, 12, 3):
+            buffer.write(np.arange(start, start + 3, dtype=np.float32))
+        np.testing.assert_array_equal(buffer.view(), np.arange(7, 12))
+        self.assertEqual(buffer.dropped, 7)
+        buffer.write(np.arange(12, 20, dtype=np.float32))
+        np.testing.assert_array_equal(buffer.view(), np.arange(15, 20))
+
+    def test_clear(self):
+        buffer = AudioRingBuffer(4, overflow=OVERFLOW_DROP_OLDEST)
+        buffer.write(np.ones(6, dtype=np.float32))
+        buffer.clear()
+        self.assertEqual((len(buffer), buffer.dropped), (0, 0))
+
+
+class DecodeChunkTests(SimpleTestCase):
+    def test_pcm16(self):
+        data = np.array([0, 16384, -32768], dtype="<i2").tobytes()
+        np.testing.assert_array_equal(decode_chunk(data, "pcm16"), [0.0, 0.5, -1.0])
+
+    def test_mulaw(self):
+        # G.711: 0xFF is zero, 0x80 and 0x00 are the largest magnitudes.
+        out = decode_chunk(bytes([0xFF, 0x80, 0x00]), "mulaw")
+        np.testing.assert_array_equal(out * 32768, [0, 32124, -32124])
+
+    def test_float16(self):
+        samples = np.array([0.25, -0.5, 1.0], dtype="<f2")
+        out = decode_chunk(samples.tobytes(), "float16")
+        self.assertEqual(out.dtype, np.float32)
+        np.testing.assert_array_equal(out, samples)
+
+    def test_unknown_encoding(self):
+        with self.assertRaises(ValueError):
+            decode_chunk(b"\x00\x00", "opus")
+
+
+class SpeechBoundsTests(SimpleTestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def test_silence(self):
+        audio = (1e-4 * self.rng.standard_normal(16000)).astype(np.float32)
+        self.assertEqual(speech_bounds(audio, 16000), (0, 0))
+
+    def test_speech_in_silence_is_padded(self):
+        audio = (1e-4 * self.rng.standard_normal(3 * 16000)).astype(np.float32)
+        audio[16000:32000] += 0.3 * np.sin(2 * np.pi * 200 * np.arange(16000) / 16000)
+        start, end = speech_bounds(audio, 16000)
+        # PADDING_MS (200 ms) around whole 30 ms frames.
+        self.assertTrue(16000 - 3200 - 480 <= start <= 16000 - 3200)
+        self.assertTrue(32000 + 3200 <= end <= 32000 + 3200 + 480)
+
+    def test_loud_continuous_speech_is_all_speech(self):
+        # A voiced tone with a syllable-rate envelope and no pauses, so the
+        # quietest frames are still speech.
+        t = np.arange(3 * 16000) / 16000
+        envelope = 0.2 + 0.8 * np.abs(np.sin(2 * np.pi * 3 * t))
+        audio = (0.3 * envelope * np.sin(2 * np.pi * 200 * t)).astype(np.float32)
+        self.assertEqual(speech_bounds(audio, 16000), (0, len(audio)))
@@ -4,4 +4,5 @@ from . import views
 
 urlpatterns = [
     path("simple_record/", views.simple_audio_recorder, name="simple_audio_recorder"),
+    path("asr/ready/", views.asr_ready, name="asr_ready"),
 ]
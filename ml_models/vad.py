@@ -0,0 +1,144 @@
+# ml_models/vad.py
+"""Energy + zero-crossing voice activity detection, vectorized in NumPy.
+
+speech_frames() and speech_bounds() look at a whole utterance; Endpointer
+applies the same frame classification to a live stream to find where the
+utterance ends.
+"""
+import numpy as np
+
+FRAME_MS = 30
+# Frames louder than max(threshold_db, noise floor + NOISE_MARGIN_DB) are speech.
+# The noise floor is the 10th percentile of the frame energies, but at most
+# the median minus NOISE_MARGIN_DB, so in an utterance with hardly any silence
+# (where the 10th percentile is speech) the louder half is still speech.
+DEFAULT_THRESHOLD_DB = -45.0
+NOISE_MARGIN_DB = 10.0
+# Quieter frames (within UNVOICED_DB of the threshold) still count as speech when
+# they cross zero often, which catches fricatives like "s" and "f".
+UNVOICED_DB = 10.0
+UNVOICED_ZCR = 0.25
+# Keep this much audio around the detected speech so onsets aren't clipped.
+PADDING_MS = 200
+
+
+def speech_frames(
+    audio: np.ndarray, sample_rate: int, threshold_db: float = DEFAULT_THRESHOLD_DB
+) -> np.ndarray:
+    """Return one boolean per FRAME_MS frame: True where the frame has speech."""
+    frame_len = sample_rate * FRAME_MS // 1000
+    n_frames = len(audio) // frame_len
+    if n_frames == 0:
+        return np.zeros(0, dtype=bool)
+    frames = audio[: n_frames * frame_len].reshape(n_frames, frame_len)
+    energy_db, zcr = _frame_features(frames)
+    return _classify(energy_db, zcr, _noise_floor(energy_db), threshold_db)
+
+
+def _frame_features(frames: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+    energy_db = 20 * np.log10(rms + 1e-10)
+    zcr = np.mean(np.diff(np.signbit(frames), axis=1), axis=1)
+    return energy_db, zcr
+
+
+def _noise_floor(energy_db: np.ndarray) -> float:
+    p10, median = np.percentile(energy_db, [10, 50])
+    return min(p10, median - NOISE_MARGIN_DB)
+
+
+def _classify(energy_db, zcr, noise_floor: float, threshold_db: float) -> np.ndarray:
+    threshold = max(threshold_db, noise_floor + NOISE_MARGIN_DB)
+    voiced = energy_db > threshold
+    unvoiced = (energy_db > threshold - UNVOICED_DB) & (zcr > UNVOICED_ZCR)
+    return voiced | unvoiced
+
+
+def speech_bounds(
+    audio: np.ndarray, sample_rate: int, threshold_db: float = DEFAULT_THRESHOLD_DB
+) -> tuple[int, int]:
+    """Return (start, end) sample indices of the speech, padded by PADDING_MS.
+
+    start == end when there is no speech. Both are multiples of the 10 ms
+    Whisper hop at 16 kHz unless clipped to the end of the audio.
+    """
+    speech = speech_frames(audio, sample_rate, threshold_db)
+    if not speech.any():
+        return 0, 0
+    frame_len = sample_rate * FRAME_MS // 1000
+    padding = sample_rate * PADDING_MS // 1000
+    first = np.argmax(speech)
+    last = len(speech) - np.argmax(speech[::-1])
+    start = max(0, first * frame_len - padding)
+    end = min(len(audio), last * frame_len + padding)
+    return int(start), int(end)
+
+
+def trim_silence(
+    audio: np.ndarray, sample_rate: int, threshold_db: float = DEFAULT_THRESHOLD_DB
+) -> np.ndarray:
+    """Drop leading and trailing non-speech. Returns an empty array for silence."""
+    start, end = speech_bounds(audio, sample_rate, threshold_db)
+    return audio[start:end]
+
+
+class Endpointer:
+    """Detect the end of an utterance in a live stream.
+
+    The utterance ends after at least `min_speech_ms` of speech followed by
+    `silence_ms` of non-speech. For `hangover_ms` after each speech frame the
+    stream still counts as speech, which bridges the short gaps inside and
+    between words; the silence is counted from the end of the hangover. The
+    noise floor comes from the frames seen so far.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        silence_ms: float,
+        min_speech_ms: float,
+        hangover_ms: float,
+        threshold_db: float = DEFAULT_THRESHOLD_DB,
+    ):
+        self.frame_len = sample_rate * FRAME_MS // 1000
+        self.silence_frames = int(silence_ms // FRAME_MS)
+        self.min_speech_frames = int(min_speech_ms // FRAME_MS)
+        self.hangover_frames = int(hangover_ms // FRAME_MS)
+        self.threshold_db = threshold_db
+        self.reset()
+
+    def reset(self):
+        self.pending = np.zeros(0, dtype=np.float32)  # samples short of a frame
+        self.energies = np.zeros(0, dtype=np.float32)
+        self.speech_frames = 0
+        self.since_speech = None  # frames since the last speech frame
+
+    def process(self, samples: np.ndarray) -> bool:
+        """Add the next samples; True once the utterance has ended."""
+        self.pending = np.concatenate([self.pending, samples])
+        n_frames = len(self.pending) // self.frame_len
+        if n_frames == 0:
+            return self.ended
+        frames = self.pending[: n_frames * self.frame_len].reshape(n_frames, self.frame_len)
+        self.pending = self.pending[n_frames * self.frame_len :]
+
+        energy_db, zcr = _frame_features(frames)
+        self.energies = np.concatenate([self.energies, energy_db])
+        noise_floor = _noise_floor(self.energies)
+        for speech in _classify(energy_db, zcr, noise_floor, self.threshold_db):
+            if speech:
+                self.since_speech = 0
+                self.speech_frames += 1
+            elif self.since_speech is not None:
+                self.since_speech += 1
+                if self.since_speech <= self.hangover_frames:
+                    self.speech_frames += 1
+        return self.ended
+
+    @property
+    def ended(self) -> bool:
+        return (
+            self.speech_frames >= self.min_speech_frames
+            and self.since_speech is not None
+            and self.since_speech - self.hangover_frames >= self.silence_frames
+        )
@@ -1,5 +1,14 @@
+from django.http import JsonResponse
 from django.shortcuts import render
 
+from .workers import start_asr_pool
+
 
 def simple_audio_recorder(request):
     return render(request, "ml_models/simple_recorder.html")
+
+
+async def asr_ready(request):
+    """Readiness probe: 200 once every ASR worker has loaded and warmed up."""
+    status = start_asr_pool().status
+    return JsonResponse({"status": status}, status=200 if status == "ready" else 503)
@@ -0,0 +1,69 @@
+# ml_models/weights.py
+"""Memory-mapped Whisper weights shared by every process that loads them.
+
+whisper.load_model() reads the (fp16) checkpoint and copies it into freshly
+allocated fp32 parameters, so every ASR worker, in every uvicorn worker,
+holds a private copy of the model. Here the fp32 state dict is written once
+to a cache file and later loads map that file instead of reading it: the
+parameters point straight into the OS page cache, which all processes share
+read-only, and only pages that are actually touched become resident.
+"""
+import logging
+import os
+import re
+from dataclasses import asdict
+from pathlib import Path
+
+import torch
+import whisper
+from whisper.model import ModelDimensions, Whisper
+
+logger = logging.getLogger(__name__)
+
+
+def cache_path(cache_dir: str, model_name: str) -> Path:
+    # model_name may also be a checkpoint path.
+    return Path(cache_dir) / f"whisper-{re.sub(r'[^A-Za-z0-9_.-]', '_', model_name)}.fp32.pt"
+
+
+def build_cache(model_name: str, path: Path):
+    """Write the fp32 state dict of `model_name`, plus the two non-persistent
+    buffers load_state_dict() doesn't restore, to `path`."""
+    model = whisper.load_model(model_name, device="cpu")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    torch.save(
+        {
+            "dims": asdict(model.dims),
+            "model_state_dict": model.state_dict(),
+            "mask": model.decoder.mask,
+            "alignment_heads": model.alignment_heads.to_dense(),
+        },
+        tmp,
+    )
+    # Several workers may build it at once; the last rename wins, harmlessly.
+    os.replace(tmp, path)
+    logger.info(f"Cached fp32 weights of Whisper '{model_name}' at {path}.")
+
+
+def load_whisper(model_name: str, device: str, cache_dir: str | None = None) -> Whisper:
+    """whisper.load_model(), with the CPU weights memory-mapped from cache_dir.
+
+    Without a cache_dir, or on a GPU (where the weights live in device memory
+    anyway), this is plain whisper.load_model().
+    """
+    if not cache_dir or device != "cpu":
+        return whisper.load_model(model_name, device=device)
+    path = cache_path(cache_dir, model_name)
+    if not path.exists():
+        build_cache(model_name, path)
+    checkpoint = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    # assign=True adopts the mapped tensors as the parameters instead of
+    # copying into the ones the constructor allocated, which are then freed.
+    model = Whisper(ModelDimensions(**checkpoint["dims"]))
+    model.load_state_dict(checkpoint["model_state_dict"], assign=True)
+    model.decoder.register_buffer("mask", checkpoint["mask"], persistent=False)
+    model.register_buffer(
+        "alignment_heads", checkpoint["alignment_heads"].to_sparse(), persistent=False
+    )
+    return model
@@ -0,0 +1,255 @@
+# ml_models/workers.py
+"""Pool of ASR worker processes so Whisper never runs on the ASGI event loop.
+
+Each worker loads its own copy of the configured ASR engine. With two-pass
+transcription (ASR_DRAFT_MODEL_NAME) a second, smaller pool runs the fast
+draft model next to the main one. Requests that arrive
+within a few milliseconds of each other (e.g. several mirrors finishing at
+once) are grouped by a MicroBatcher and decoded as one batch. Audio is handed
+over through a shared-memory block instead of being pickled, and results
+come back as futures the consumer can await.
+"""
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import torch
+from django.conf import settings
+
+from . import asr
+from .batching import MicroBatcher
+from .engines import load_engine
+
+logger = logging.getLogger(__name__)
+
+_pools: dict[str, "ASRWorkerPool"] = {}
+# The engine loaded by _init_worker, in each worker process.
+_engine = None
+
+
+def _init_worker(
+    engine_name: str,
+    model_name: str,
+    device: str,
+    num_threads: int,
+    weights_dir: str | None,
+):
+    global _engine
+    # Split the cores between workers instead of letting each one grab them all.
+    torch.set_num_threads(num_threads)
+    _engine = load_engine(engine_name, model_name, device, weights_dir)
+    # Pay first-call allocation and kernel setup now rather than on a user's
+    # first utterance.
+    _engine.transcribe(np.zeros(asr.TARGET_SAMPLE_RATE, dtype=np.float32))
+    logger.info(
+        f"ASR worker {os.getpid()} loaded and warmed up {engine_name} '{model_name}'."
+    )
+
+
+def _worker_info() -> tuple[int, int]:
+    return os.getpid(), _engine.n_mels
+
+
+def _unpack(shm: SharedMemory, shapes: list[tuple]) -> list[np.ndarray]:
+    sizes = [int(np.prod(shape)) for shape in shapes]
+    packed = np.ndarray((sum(sizes),), dtype=np.float32, buffer=shm.buf)
+    bounds = np.cumsum([0] + sizes)
+    return [
+        packed[a:b].reshape(shape) for a, b, shape in zip(bounds[:-1], bounds[1:], shapes)
+    ]
+
+
+def _transcribe_shared(shm_name: str, shapes: list[tuple], partial: bool) -> list[str]:
+    shm = SharedMemory(name=shm_name)
+    try:
+        inputs = _unpack(shm, shapes)
+        texts = _engine.transcribe_batch(inputs, partial)
+        del inputs  # release the views before closing the mapping
+        return texts
+    finally:
+        shm.close()
+
+
+def _score_shared(shm_name: str, shapes: list[tuple], phrases: list[str]) -> list[float]:
+    shm = SharedMemory(name=shm_name)
+    try:
+        inputs = _unpack(shm, shapes)
+        scores = _engine.score_phrases(inputs[0], phrases)
+        del inputs  # release the views before closing the mapping
+        return scores
+    finally:
+        shm.close()
+
+
+class ASRWorkerPool:
+    def __init__(
+        self,
+        workers: int,
+        engine_name: str,
+        model_name: str,
+        device: str,
+        max_batch_size: int = 1,
+        max_wait_ms: float = 0,
+        weights_dir: str | None = None,
+        total_workers: int | None = None,
+    ):
+        self.workers = max(1, workers)
+        # The cores are split between the workers of every pool that decodes
+        # at the same time (`total_workers`), not just this one's.
+        num_threads = max(1, (os.cpu_count() or 1) // max(self.workers, total_workers or 0))
+        self.initargs = (engine_name, model_name, device, num_threads, weights_dir)
+        self.executor = self._new_executor()
+
+        # Partials and finals use different decoding options, so batch them apart.
+        self.batchers = {
+            partial: MicroBatcher(
+                functools.partial(self.transcribe_batch, partial=partial),
+                max_batch_size,
+                max_wait_ms,
+            )
+            for partial in (False, True)
+        }
+        self.ready = asyncio.Event()
+        self.error: Exception | None = None
+        # Mel bins the engine expects, known once a worker has started.
+        self.n_mels: int | None = None
+        self.warm_up_task: asyncio.Task | None = None
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            # fork would copy the event loop and CUDA state into the children.
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=self.initargs,
+        )
+
+    def _restart(self, broken: ProcessPoolExecutor, error: Exception):
+        """Replace an executor that lost a worker (e.g. OOM-killed): a broken
+        ProcessPoolExecutor fails every later job. The pool reports "error"
+        until the new workers have warmed up."""
+        if self.executor is not broken:
+            return  # another failed job already restarted it
+        logger.error(f"An ASR worker died ({error}); restarting the worker pool.")
+        broken.shutdown(wait=False, cancel_futures=True)
+        self.executor = self._new_executor()
+        self.error = error
+        self.ready.clear()
+        self.warm_up_task = asyncio.create_task(self.warm_up())
+
+    async def warm_up(self):
+        """Start every worker (model load + dummy decode) and then set `ready`.
+
+        The executor only spawns processes when jobs are waiting, and a worker
+        takes jobs only after its initializer has run, so keep submitting
+        trivial jobs until every worker has answered one.
+        """
+        pids = set()
+        try:
+            while len(pids) < self.workers:
+                futures = [
+                    asyncio.wrap_future(self.executor.submit(_worker_info))
+                    for _ in range(self.workers)
+                ]
+                for pid, n_mels in await asyncio.gather(*futures):
+                    pids.add(pid)
+                    self.n_mels = n_mels
+                if len(pids) < self.workers:
+                    await asyncio.sleep(0.1)
+        except Exception as e:
+            logger.error(f"ASR worker pool failed to start: {e}", exc_info=True)
+            self.error = e
+            return
+        self.error = None
+        self.ready.set()
+        logger.info(f"ASR worker pool ready ({self.workers} worker(s)).")
+
+    @property
+    def status(self) -> str:
+        if self.error is not None:
+            return "error"
+        return "ready" if self.ready.is_set() else "warming_up"
+
+    async def transcribe(self, audio: np.ndarray, partial: bool = False) -> str:
+        """Transcribe 1-D audio or a precomputed (n_mels, 3000) log-mel window
+        with the pool's n_mels."""
+        return await self.batchers[partial].submit(audio)
+
+    async def transcribe_batch(
+        self, inputs: list[np.ndarray], partial: bool = False
+    ) -> list[str]:
+        return await self._submit_shared(inputs, _transcribe_shared, partial)
+
+    async def score_phrases(self, audio: np.ndarray, phrases: list[str]) -> list[float]:
+        return await self._submit_shared([audio], _score_shared, phrases)
+
+    async def _submit_shared(self, arrays: list[np.ndarray], fn, *args):
+        """Pack `arrays` into one shared-memory block and run
+        fn(name, shapes, *args) in a worker."""
+        total = sum(a.size for a in arrays)
+        shm = SharedMemory(create=True, size=max(total * 4, 1))
+        try:
+            packed = np.ndarray((total,), dtype=np.float32, buffer=shm.buf)
+            offset = 0
+            for array in arrays:
+                packed[offset : offset + array.size] = array.ravel()
+                offset += array.size
+            del packed
+            shapes = [array.shape for array in arrays]
+            executor = self.executor
+            try:
+                return await asyncio.wrap_future(executor.submit(fn, shm.name, shapes, *args))
+            except BrokenProcessPool as e:
+                self._restart(executor, e)
+                raise
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_asr_pool(draft: bool = False) -> ASRWorkerPool:
+    """The pool running ASR_MODEL_NAME, or ASR_DRAFT_MODEL_NAME when `draft`."""
+    key = "draft" if draft else "final"
+    if key not in _pools:
+        pool = ASRWorkerPool(
+            settings.ASR_DRAFT_WORKERS if draft else settings.ASR_WORKERS,
+            settings.ASR_ENGINE,
+            settings.ASR_DRAFT_MODEL_NAME if draft else settings.ASR_MODEL_NAME,
+            asr.DEVICE,
+            max_batch_size=settings.ASR_BATCH_SIZE,
+            max_wait_ms=settings.ASR_BATCH_WAIT_MS,
+            weights_dir=settings.ASR_WEIGHTS_CACHE_DIR,
+            # The draft and final pools decode every utterance together.
+            total_workers=settings.ASR_WORKERS
+            + (settings.ASR_DRAFT_WORKERS if settings.ASR_DRAFT_MODEL_NAME else 0),
+        )
+        logger.info(f"Started {key} ASR worker pool with {pool.workers} worker(s).")
+        _pools[key] = pool
+    return _pools[key]
+
+
+def start_asr_pool() -> ASRWorkerPool:
+    """Create the pool(s) and warm them up in the background (ASGI lifespan
+    startup). Returns the main pool."""
+    pools = [get_asr_pool()]
+    if settings.ASR_DRAFT_MODEL_NAME:
+        pools.append(get_asr_pool(draft=True))
+    for pool in pools:
+        if pool.warm_up_task is None:
+            pool.warm_up_task = asyncio.create_task(pool.warm_up())
+    return pools[0]
+
+
+def shutdown_asr_pool():
+    for pool in _pools.values():
+        pool.shutdown()
+    _pools.clear()
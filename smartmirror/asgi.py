@@ -15,6 +15,7 @@ from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 
 from mirror.services import MCPService
+from ml_models.workers import start_asr_pool, shutdown_asr_pool
 import ml_models.routing
 
 logger = logging.getLogger(__name__)
@@ -34,6 +35,7 @@ async def lifespan_handler(scope, receive, send):
                 logger.info("Lifespan startup: Initializing MCPService...")
                 mcp_service_instance = await MCPService.get_instance()
                 await mcp_service_instance.connect()
+                start_asr_pool()
                 await send({"type": "lifespan.startup.complete"})
                 logger.info("MCPService startup complete.")
             except Exception as e:
@@ -44,6 +46,7 @@ async def lifespan_handler(scope, receive, send):
                 logger.info("Lifespan shutdown: Shutting down MCPService...")
                 if mcp_service_instance:
                     await mcp_service_instance.shutdown()
+                shutdown_asr_pool()
                 await send({"type": "lifespan.shutdown.complete"})
                 logger.info("MCPService shutdown complete.")
             except Exception as e:
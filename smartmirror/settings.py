@@ -24,6 +24,53 @@ GOOGLE_CALENDAR_IDS = os.getenv("GOOGLE_CALENDAR_IDS", "").split(",")
 GOOGLE_CALENDAR_CRED_PATH = os.getenv("GOOGLE_CALENDAR_CRED_PATH")
 CLOSET_INVENTORY = fetch_closet_inventory(os.getenv("CLOSET_INVENTORY_DB_ID"))
 OUTFITS_DB_ID=os.getenv("OUTFITS_DB_ID", "")
+# Speech recognition engine (see ml_models.engines.ENGINES) and model size.
+# "whisper_int8" is the faster choice on CPU-only mirrors.
+ASR_ENGINE = os.getenv("ASR_ENGINE", "whisper")
+ASR_MODEL_NAME = os.getenv("ASR_MODEL_NAME", "small.en")
+# Number of ASR worker processes, each holding its own Whisper model.
+ASR_WORKERS = int(os.getenv("ASR_WORKERS", "1"))
+# CPU model weights are converted once to a file here and memory-mapped by
+# every worker (in every uvicorn worker), so they share one copy in RAM.
+# whisper_int8 only shares the layers it doesn't quantize: each worker keeps a
+# private int8 copy of the Linear weights.
+# Empty loads a private copy per worker, as whisper.load_model() does.
+ASR_WEIGHTS_CACHE_DIR = os.getenv(
+    "ASR_WEIGHTS_CACHE_DIR", os.path.expanduser("~/.cache/smartmirror")
+)
+# Two-pass transcription: when set, this smaller model sends a draft transcript
+# (and the partials) first, and ASR_MODEL_NAME re-decodes in the background,
+# sending a correction only if its text differs. Empty disables it.
+ASR_DRAFT_MODEL_NAME = os.getenv("ASR_DRAFT_MODEL_NAME", "")
+ASR_DRAFT_WORKERS = int(os.getenv("ASR_DRAFT_WORKERS", "1"))
+# Decodes finishing within ASR_BATCH_WAIT_MS of each other share one batched
+# decode of up to ASR_BATCH_SIZE utterances. ASR_BATCH_SIZE=1 disables batching.
+ASR_BATCH_SIZE = int(os.getenv("ASR_BATCH_SIZE", "4"))
+ASR_BATCH_WAIT_MS = float(os.getenv("ASR_BATCH_WAIT_MS", "10"))
+# Each ASR connection preallocates room for this much 16 kHz audio. When it
+# fills, "finish" transcribes what was received and ends the utterance;
+# "drop_oldest" keeps listening and keeps only the most recent audio.
+ASR_MAX_UTTERANCE_SECONDS = float(os.getenv("ASR_MAX_UTTERANCE_SECONDS", "120"))
+ASR_OVERFLOW_POLICY = os.getenv("ASR_OVERFLOW_POLICY", "finish")
+# Utterances up to ASR_COMMAND_MAX_SECONDS are checked against this grammar
+# before a full decode; a phrase scoring at least ASR_COMMAND_MIN_LOGPROB (mean
+# log-probability per token) is sent to the client as a "command" frame.
+# With ASR_DRAFT_MODEL_NAME set, the draft model does the scoring.
+ASR_COMMANDS = {
+    "confirm": ["yes", "yeah", "yep", "confirm", "do it", "okay"],
+    "deny": ["no", "nope", "cancel", "deny", "stop"],
+}
+ASR_COMMAND_MAX_SECONDS = float(os.getenv("ASR_COMMAND_MAX_SECONDS", "2"))
+ASR_COMMAND_MIN_LOGPROB = float(os.getenv("ASR_COMMAND_MIN_LOGPROB", "-1.0"))
+# Frames quieter than this (dBFS) are treated as silence and never decoded.
+ASR_VAD_THRESHOLD_DB = float(os.getenv("ASR_VAD_THRESHOLD_DB", "-45"))
+# Server-side endpointing (clients opt in with "endpointing": true): the
+# utterance ends after ASR_ENDPOINT_MIN_SPEECH_MS of speech followed by
+# ASR_ENDPOINT_SILENCE_MS of silence. Speech is held for ASR_ENDPOINT_HANGOVER_MS
+# after it drops, so short pauses between words don't count as silence.
+ASR_ENDPOINT_SILENCE_MS = float(os.getenv("ASR_ENDPOINT_SILENCE_MS", "700"))
+ASR_ENDPOINT_MIN_SPEECH_MS = float(os.getenv("ASR_ENDPOINT_MIN_SPEECH_MS", "300"))
+ASR_ENDPOINT_HANGOVER_MS = float(os.getenv("ASR_ENDPOINT_HANGOVER_MS", "150"))
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent